@@ -125,7 +125,12 @@ export async function POST(request: Request) {
               messages: convertToModelMessages(uiMessages),
               selectedChatModel,
               requestHints,
+              chatId: id,
+              userId: session.user.id,
+              priority: userType === 'guest' ? 'low' : 'normal',
             }),
+            // Abort the backend run when the browser goes away
+            signal: request.signal,
           });
 
           if (!pythonResponse.ok) {
@@ -42,6 +42,14 @@ const MAX_BYTES_BY_MIME: Record<string, number> = {
   'image/png': 10 * 1024 * 1024,
 };
 
+// Types the Python backend extracts ahead of the chat turn
+const INGESTED_MIME_TYPES = new Set([
+  'application/pdf',
+  'text/csv',
+  'application/vnd.ms-excel',
+  'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+]);
+
 function inferMimeFromName(name: string | undefined, fallback: string) {
   if (!name) return fallback;
   const lower = name.toLowerCase();
@@ -122,6 +130,17 @@ export async function POST(request: Request) {
       contentType,
     });
 
+    // Start extraction on the Python backend now, so the chat turn that
+    // references this file does not wait for it (if this fails, the chat turn
+    // extracts the file itself)
+    if (INGESTED_MIME_TYPES.has(contentType)) {
+      fetch('http://localhost:8000/api/ingest', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ url: data.url, filename, mediaType: contentType }),
+      }).catch(() => {});
+    }
+
     // Mirror the response shape your client expects
     // (url, pathname, contentType)
     return NextResponse.json({
@@ -0,0 +1,398 @@
+"""
+Load-test /api/chat offline, with a stub model backend.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.bench_chat --clients 1 8 32 --requests 200
+
+The API is started in a child process where Runner.run_streamed is replaced by
+a stub that replays synthetic (or recorded) agent events at a fixed token rate,
+so only the Python layer is measured. PDF and CSV fixtures are generated and
+served from a local HTTP server for the [File: ...] attachment path.
+
+For each scenario and client count the report shows requests/sec, time to
+first text delta (p50/p90/p99), total stream latency and the server's CPU time
+and peak RSS growth per concurrent stream.
+
+A recording is a JSONL file of agent events, one per line, with an optional
+"delay_ms" before the event is emitted, e.g.
+
+    {"type": "text.delta", "delta": "Hello", "delay_ms": 12}
+    {"type": "raw_response_event", "data": {"type": "response.output_item.added", "item": {"type": "web_search_call", "id": "ws_1"}}}
+"""
+import argparse
+import asyncio
+import functools
+import http.server
+import json
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+import pandas as pd
+
+
+SCENARIOS = ("text", "csv", "pdf", "tools")
+
+
+# --- stub model backend ---
+
+def _to_namespace(value: Any) -> Any:
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _to_namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_to_namespace(item) for item in value]
+    return value
+
+
+def load_recording(path: str) -> List[tuple]:
+    """Read a JSONL recording into (delay seconds, event) pairs"""
+    from openai.types.responses import ResponseTextDeltaEvent
+
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            raw = json.loads(line)
+            delay = raw.pop("delay_ms", 0) / 1000
+            data = raw.get("data")
+            if raw.get("type") == "raw_response_event" and data and data.get("type") == "response.output_text.delta":
+                # text_delta() recognises raw text deltas by their class
+                ev = SimpleNamespace(type="raw_response_event", data=ResponseTextDeltaEvent.model_construct(**data))
+            else:
+                ev = _to_namespace(raw)
+            events.append((delay, ev))
+    return events
+
+
+class StubStream:
+    """Stands in for RunResultStreaming: emits tool calls, text deltas and optional errors"""
+
+    def __init__(self, options: Dict[str, Any], recording: Optional[List[tuple]]):
+        self.options = options
+        self.recording = recording
+
+    async def stream_events(self):
+        if self.recording is not None:
+            for delay, ev in self.recording:
+                if delay:
+                    await asyncio.sleep(delay)
+                yield ev
+            return
+
+        opts = self.options
+        for i in range(opts["tool_calls"]):
+            item = SimpleNamespace(type="web_search_call", id=f"ws_{i}")
+            yield SimpleNamespace(type="raw_response_event", data=SimpleNamespace(type="response.output_item.added", item=item))
+            await asyncio.sleep(opts["tool_latency"])
+            yield SimpleNamespace(type="raw_response_event", data=SimpleNamespace(type="response.output_item.done", item=item))
+
+        interval = 1 / opts["token_rate"] if opts["token_rate"] > 0 else 0
+        for i in range(opts["tokens"]):
+            if interval:
+                await asyncio.sleep(interval)
+            elif i % 64 == 0:
+                await asyncio.sleep(0)
+            yield SimpleNamespace(type="text.delta", delta=opts["token_text"])
+
+        if opts["error_rate"] and random.random() < opts["error_rate"]:
+            yield SimpleNamespace(type="error", error="stub_error")
+
+    def cancel(self, mode: str = "immediate") -> None:
+        """stream_chat_py cancels runs that end early; there is no upstream run to stop"""
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is KiB on Linux; a high-water mark is the best we get elsewhere
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """Tracks peak RSS of the server process between resets"""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = _rss_bytes()
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.peak = max(self.peak, _rss_bytes())
+            time.sleep(self.interval)
+
+    def reset(self) -> int:
+        current = _rss_bytes()
+        self.peak = current
+        return current
+
+
+def serve_api(port: int, options: Dict[str, Any], recording_path: Optional[str], env: Dict[str, str]) -> None:
+    """Child process entry point: the real app with a stub Runner"""
+    os.environ.update(env)
+
+    import logging
+    import uvicorn
+    from backend import main
+    from backend.chat_agents import chat
+
+    recording = load_recording(recording_path) if recording_path else None
+    chat.Runner = SimpleNamespace(run_streamed=lambda agent, input, **kwargs: StubStream(options, recording))
+
+    # Per-download request logs would dominate the output and the CPU profile
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    sampler = RssSampler()
+
+    @main.app.get("/__bench/usage")
+    async def usage(reset: bool = False):
+        ru = resource.getrusage(resource.RUSAGE_SELF)
+        body = {"cpu": ru.ru_utime + ru.ru_stime, "rss": _rss_bytes(), "peak_rss": sampler.peak}
+        if reset:
+            body["rss"] = sampler.reset()
+        return body
+
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# --- fixtures ---
+
+def make_csv(rows: int, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "Event Date": rng.choice(pd.date_range("2023-01-01", "2024-12-31").strftime("%Y-%m-%d"), rows),
+        "Region": rng.choice(["North", "South", "West", "Mid Atlantic"], rows),
+        "Claim Type": rng.choice(["inpatient", "outpatient", "pharmacy"], rows),
+        "Paid Amount": rng.gamma(2.0, 150.0, rows).round(2),
+    })
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def make_pdf(pages: int, lines_per_page: int = 40) -> bytes:
+    """Minimal multi-page text PDF, enough for PyPDF2 text extraction"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        lines = [f"Page {page + 1} line {line}: member visits, claims and utilization notes." for line in range(lines_per_page)]
+        text = " T* ".join(f"({line})" for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 40 800 Td {text} Tj ET".replace(") T* (", ") Tj T* (").encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % pages
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_file_server(directory: str) -> int:
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- load generator ---
+
+def scenario_messages(scenario: str, file_port: int, query: str = "") -> List[Dict[str, Any]]:
+    base = f"http://127.0.0.1:{file_port}"
+    content = "Summarize recent utilization trends."
+    if scenario == "csv":
+        content += f" [File: claims.csv (text/csv) - URL: {base}/claims.csv{query}]"
+    elif scenario == "pdf":
+        content += f" [File: report.pdf (application/pdf) - URL: {base}/report.pdf{query}]"
+    return [{"role": "user", "content": content}]
+
+
+def request_body(scenario: str, file_port: int, cold: bool) -> Dict[str, Any]:
+    """
+    A new body per request. Each gets its own chatId, so the per-chat context
+    store never answers for it. With --cold-cache the attachment URL is unique
+    too, so the file cache and dataset store miss and the file is extracted again.
+    """
+    token = uuid.uuid4().hex
+    return {
+        "messages": scenario_messages(scenario, file_port, f"?r={token}" if cold else ""),
+        "selectedChatModel": "chat-model",
+        "requestHints": {},
+        "chatId": token,
+    }
+
+
+async def one_request(client: httpx.AsyncClient, body: Dict[str, Any]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    ttft = None
+    error = False
+    async with client.stream("POST", "/api/chat", json=body) as response:
+        async for chunk in response.aiter_bytes():
+            if ttft is None and b'"type":"text-delta"' in chunk:
+                ttft = time.perf_counter() - start
+            if b'"type":"error"' in chunk:
+                error = True
+        error = error or response.status_code != 200
+    return {"ttft": ttft, "latency": time.perf_counter() - start, "error": error}
+
+
+async def run_load(api_url: str, make_body: Callable[[], Dict[str, Any]], clients: int, requests: int) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=api_url, limits=limits, timeout=None) as client:
+        usage = (await client.get("/__bench/usage", params={"reset": True})).json()
+        remaining = requests
+        results: List[Dict[str, Any]] = []
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                results.append(await one_request(client, make_body()))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+
+        after = (await client.get("/__bench/usage")).json()
+
+    return {
+        "elapsed": elapsed,
+        "results": results,
+        "cpu": after["cpu"] - usage["cpu"],
+        "rss_growth": max(0, after["peak_rss"] - usage["rss"]),
+    }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(pct) - 1]
+
+
+def report(scenario: str, clients: int, run: Dict[str, Any]) -> None:
+    results = run["results"]
+    ttft = [r["ttft"] * 1000 for r in results if r["ttft"] is not None]
+    latency = [r["latency"] * 1000 for r in results]
+    errors = sum(r["error"] for r in results)
+    print(
+        f"{scenario:<6} {clients:>4} {len(results) / run['elapsed']:>8.1f}"
+        f" {percentile(ttft, 50):>8.1f} {percentile(ttft, 90):>8.1f} {percentile(ttft, 99):>8.1f}"
+        f" {percentile(latency, 50):>8.1f} {percentile(latency, 99):>8.1f}"
+        f" {run['cpu'] / len(results) * 1000:>9.2f} {run['rss_growth'] / clients / 1024:>10.1f} {errors:>5}"
+    )
+
+
+def wait_for(url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"API did not start at {url}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and client count")
+    parser.add_argument("--tokens", type=int, default=300, help="text deltas per response")
+    parser.add_argument("--token-rate", type=float, default=0, help="deltas/sec per stream (0 = as fast as possible)")
+    parser.add_argument("--token-text", default="tok ")
+    parser.add_argument("--tool-latency-ms", type=float, default=50, help="web search call latency in the tools scenario")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of streams ending in an error event")
+    parser.add_argument("--recording", help="replay a JSONL event recording instead of synthetic events")
+    parser.add_argument("--csv-rows", type=int, default=50_000)
+    parser.add_argument("--pdf-pages", type=int, default=64)
+    parser.add_argument("--cold-cache", action="store_true", help="extract every request's attachment from scratch")
+    parser.add_argument("--code-workers", type=int, default=0, help="ATLAS_CODE_WORKERS for the server")
+    args = parser.parse_args()
+
+    fixtures = tempfile.mkdtemp(prefix="atlas_bench_")
+    with open(os.path.join(fixtures, "claims.csv"), "wb") as f:
+        f.write(make_csv(args.csv_rows))
+    with open(os.path.join(fixtures, "report.pdf"), "wb") as f:
+        f.write(make_pdf(args.pdf_pages))
+    file_port = start_file_server(fixtures)
+
+    env = {
+        "ATLAS_CODE_WORKERS": str(args.code_workers),
+        "ATLAS_DATASET_DIR": os.path.join(fixtures, "datasets"),
+        "ATLAS_FILE_CACHE_DIR": "" if args.cold_cache else os.path.join(fixtures, "file_cache"),
+    }
+    if args.cold_cache:
+        env["ATLAS_FILE_CACHE_MEMORY_BYTES"] = "0"
+
+    print(
+        f"{'scen':<6} {'cli':>4} {'req/s':>8} {'ttft50':>8} {'ttft90':>8} {'ttft99':>8}"
+        f" {'lat50':>8} {'lat99':>8} {'cpu ms/rq':>9} {'KiB/strm':>10} {'err':>5}"
+    )
+
+    for scenario in args.scenarios:
+        options = {
+            "tokens": args.tokens,
+            "token_rate": args.token_rate,
+            "token_text": args.token_text,
+            "tool_calls": 1 if scenario == "tools" else 0,
+            "tool_latency": args.tool_latency_ms / 1000,
+            "error_rate": args.error_rate,
+        }
+        port = _free_port()
+        server = multiprocessing.get_context("spawn").Process(
+            target=serve_api, args=(port, options, args.recording, env), daemon=True
+        )
+        server.start()
+        api_url = f"http://127.0.0.1:{port}"
+        try:
+            wait_for(api_url + "/__bench/usage")
+            make_body = functools.partial(request_body, scenario, file_port, args.cold_cache)
+            # One request first so imports and the file cache are warm (unless --cold-cache)
+            asyncio.run(run_load(api_url, make_body, 1, 1))
+            for clients in args.clients:
+                report(scenario, clients, asyncio.run(run_load(api_url, make_body, clients, args.requests)))
+        finally:
+            server.terminate()
+            server.join(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
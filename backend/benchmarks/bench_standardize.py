@@ -0,0 +1,192 @@
+"""
+Benchmark standardize_file against the previous implementation.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.bench_standardize --rows 1000000 10000000
+
+Each size runs the old path, the new in-memory path and the new chunked path on
+the same synthetic claims-style frame, checks that the outputs match and
+reports wall time and peak traced memory.
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from backend.chat_agents.data_analyst_agent.utils import standardize_file, standardize_file_chunks
+
+
+def legacy_standardize_file(df_input, default_year=2025, **kwargs):
+    """standardize_file as it was before the vectorized rewrite, kept for comparison"""
+    POSSIBLE_TIME_COLUMNS = [
+        'DATE', 'MONTH', 'TIME', 'PERIOD', 'YEARMONTH', 'DATETIME', 'TIMESTAMP',
+        'DATE_TIME', 'DT', 'TRANS_DT', 'EVENT_DATE', 'ACTIVITY_DATE'
+    ]
+    MONTH_MAP = {
+        'JAN': 1, 'JANUARY': 1, 'FEB': 2, 'FEBRUARY': 2, 'MAR': 3, 'MARCH': 3,
+        'APR': 4, 'APRIL': 4, 'MAY': 5, 'JUN': 6, 'JUNE': 6, 'JUL': 7, 'JULY': 7,
+        'AUG': 8, 'AUGUST': 8, 'SEP': 9, 'SEPT': 9, 'SEPTEMBER': 9, 'OCT': 10, 'OCTOBER': 10,
+        'NOV': 11, 'NOVEMBER': 11, 'DEC': 12, 'DECEMBER': 12
+    }
+
+    if df_input.empty:
+        return pd.DataFrame()
+
+    df = df_input.copy()
+    df.columns = [str(col).upper().strip().replace(' ', '_') for col in df.columns]
+    standardized_cols = df.columns
+
+    time_col_name = next((col for col in POSSIBLE_TIME_COLUMNS if col in standardized_cols), None)
+    processed_date_col_name = None
+    new_date_col = 'DATE'
+
+    if time_col_name:
+        try:
+            original_dtype = df[time_col_name].dtype
+            temp_standardized_dates_str = pd.Series(index=df.index, dtype=str)
+
+            is_likely_month_col = False
+            if time_col_name == 'MONTH' and pd.api.types.is_string_dtype(original_dtype):
+                try:
+                    unique_vals = df[time_col_name].dropna().astype(str).str.upper().unique()
+                    if any(m in MONTH_MAP for m in unique_vals[:10]):
+                        is_likely_month_col = True
+                except Exception:
+                    pass
+
+            if is_likely_month_col:
+                month_nums = df[time_col_name].astype(str).str.upper().map(MONTH_MAP)
+                base_valid_idx = month_nums.notna()
+
+                year_values_for_construction = pd.Series(index=df.index, dtype='object')
+                actual_default_year = default_year if default_year is not None else pd.Timestamp.now().year
+
+                if 'YEAR' in standardized_cols:
+                    year_series_numeric = pd.to_numeric(df['YEAR'], errors='coerce')
+                    year_values_for_construction = year_series_numeric.fillna(actual_default_year)
+                else:
+                    year_values_for_construction.fillna(actual_default_year, inplace=True)
+
+                final_valid_idx = base_valid_idx & \
+                                  year_values_for_construction.notna() & \
+                                  (year_values_for_construction.apply(lambda x: isinstance(x, (int, float)) and x == int(x)))
+
+                if final_valid_idx.any():
+                    years_str = year_values_for_construction[final_valid_idx].astype(int).astype(str)
+                    months_str = month_nums[final_valid_idx].astype(int).astype(str).str.zfill(2)
+                    temp_standardized_dates_str.loc[final_valid_idx] = years_str + '-' + months_str + '-' + "01"
+            else:
+                datetime_col = pd.to_datetime(df[time_col_name], errors='coerce')
+                valid_idx = datetime_col.notna()
+                if valid_idx.any():
+                    temp_standardized_dates_str.loc[valid_idx] = datetime_col[valid_idx].dt.strftime('%Y-%m-%d')
+
+            if not temp_standardized_dates_str.isnull().all():
+                df[new_date_col] = temp_standardized_dates_str.replace({np.nan: None})
+                processed_date_col_name = new_date_col
+                if time_col_name != new_date_col and time_col_name in df.columns:
+                    df = df.drop(columns=[time_col_name])
+                cols = [processed_date_col_name] + [col for col in df.columns if col != processed_date_col_name]
+                df = df[cols]
+            else:
+                if new_date_col in df.columns and df[new_date_col].isnull().all():
+                    df = df.drop(columns=[new_date_col], errors='ignore')
+        except Exception:
+            processed_date_col_name = None
+
+    try:
+        string_cols = df.select_dtypes(include=['object', 'string']).columns
+        if processed_date_col_name and processed_date_col_name in string_cols:
+            string_cols = string_cols.drop(processed_date_col_name)
+        for col in string_cols:
+            if col in df.columns:
+                mask_notna = df[col].notna()
+                df.loc[mask_notna, col] = df.loc[mask_notna, col].astype(str).str.strip().str.upper().str.replace(' ', '_')
+    except Exception:
+        pass
+
+    return df
+
+
+def make_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Synthetic claims extract: ISO date strings, low-cardinality labels, a member id and amounts"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2019-01-01", "2025-12-31", freq="D").strftime("%Y-%m-%d").to_numpy()
+    return pd.DataFrame({
+        "Event Date": rng.choice(dates, rows),
+        "Region Name": rng.choice(["north east", " south", "west ", "mid atlantic", None], rows),
+        "Claim Type": rng.choice(["inpatient", "outpatient", "pharmacy", "er visit"], rows),
+        "Member Id": rng.integers(0, rows // 4 + 1, rows).astype(str),
+        "Paid Amount": rng.gamma(2.0, 150.0, rows).round(2),
+    })
+
+
+def make_month_frame(rows: int, seed: int = 1) -> pd.DataFrame:
+    """Month-name variant that exercises the MONTH + YEAR path"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Month": rng.choice(["Jan", "February", "mar", "APR", "may", "June"], rows),
+        "Year": rng.choice([2022, 2023, 2024], rows),
+        "Plan": rng.choice(["hmo", "ppo", "medicare advantage"], rows),
+        "Visits": rng.integers(0, 50, rows),
+    })
+
+
+def measure(func, *args, memory: bool):
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def chunked(df: pd.DataFrame, chunksize: int) -> pd.DataFrame:
+    chunks = (df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize))
+    return pd.concat(standardize_file_chunks(chunks))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--chunksize", type=int, default=500_000)
+    parser.add_argument("--memory", action="store_true", help="trace peak allocations (slows every run)")
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    for make in (make_frame, make_month_frame):
+        for rows in args.rows:
+            df = make(rows)
+            print(f"\n{make.__name__} rows={rows:,}")
+
+            results = {}
+            runs = [("new", standardize_file, (df,)), ("chunked", chunked, (df, args.chunksize))]
+            if not args.skip_legacy:
+                runs.insert(0, ("legacy", legacy_standardize_file, (df,)))
+
+            for name, func, func_args in runs:
+                result, elapsed, peak = measure(func, *func_args, memory=args.memory)
+                results[name] = result
+                line = f"  {name:<8} {elapsed:8.2f}s"
+                if peak is not None:
+                    line += f"  peak {peak / 1024 ** 2:8.1f} MiB"
+                print(line)
+
+            if "legacy" in results:
+                pd.testing.assert_frame_equal(results["legacy"], results["new"])
+                pd.testing.assert_frame_equal(
+                    results["legacy"].reset_index(drop=True),
+                    results["chunked"].reset_index(drop=True),
+                )
+                print("  outputs match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from .metrics import ADMISSION_REJECTED, QUEUE_WAIT, STREAMS_QUEUED
+from .sse import frame
+
+
+logger = logging.getLogger(__name__)
+
+MAX_ACTIVE_STREAMS = int(os.getenv("ATLAS_MAX_ACTIVE_STREAMS", "64"))
+MAX_STREAMS_PER_USER = int(os.getenv("ATLAS_MAX_STREAMS_PER_USER", "4"))
+MAX_QUEUED_STREAMS = int(os.getenv("ATLAS_MAX_QUEUED_STREAMS", "256"))
+
+# Lower value is admitted first
+PRIORITY_CLASSES: Dict[str, int] = {"high": 0, "normal": 1, "low": 2}
+DEFAULT_PRIORITY = "normal"
+
+
+class Overloaded(Exception):
+    """Raised when the admission queue is full"""
+
+
+class Ticket:
+    __slots__ = ("user_id", "priority", "seq", "admitted", "released", "enqueued_at", "_changed")
+
+    def __init__(self, user_id: Optional[str], priority: int, seq: int):
+        self.user_id = user_id
+        self.priority = priority
+        self.seq = seq
+        self.admitted = False
+        self.released = False
+        self.enqueued_at = time.perf_counter()
+        self._changed = asyncio.Event()
+
+
+class AdmissionController:
+    """
+    Limits concurrent chat streams globally and per user.
+
+    Requests over the limits wait in a bounded queue ordered by priority class
+    and arrival. Whenever a stream finishes, the first queued request whose
+    user is under the per-user limit is admitted, so one user's backlog does
+    not hold up everyone behind it. Runs on the event loop; not thread-safe.
+    """
+
+    def __init__(
+        self,
+        max_active: int = MAX_ACTIVE_STREAMS,
+        max_per_user: int = MAX_STREAMS_PER_USER,
+        max_queued: int = MAX_QUEUED_STREAMS,
+    ):
+        self.max_active = max_active
+        self.max_per_user = max_per_user
+        self.max_queued = max_queued
+        self._active = 0
+        self._per_user: Counter = Counter()
+        self._queue: List[Ticket] = []
+        self._seq = itertools.count()
+
+    def _can_run(self, user_id: Optional[str]) -> bool:
+        if self._active >= self.max_active:
+            return False
+        return user_id is None or self._per_user[user_id] < self.max_per_user
+
+    def _admit(self, ticket: Ticket) -> None:
+        ticket.admitted = True
+        self._active += 1
+        if ticket.user_id is not None:
+            self._per_user[ticket.user_id] += 1
+        QUEUE_WAIT.observe(time.perf_counter() - ticket.enqueued_at)
+
+    def enqueue(self, user_id: Optional[str] = None, priority: Optional[str] = None) -> Ticket:
+        """Admit immediately if possible, otherwise queue; raises Overloaded when the queue is full"""
+        rank = PRIORITY_CLASSES.get(priority or DEFAULT_PRIORITY, PRIORITY_CLASSES[DEFAULT_PRIORITY])
+        ticket = Ticket(user_id, rank, next(self._seq))
+
+        self._queue.append(ticket)
+        self._queue.sort(key=lambda t: (t.priority, t.seq))
+        self._dispatch()
+
+        if not ticket.admitted and len(self._queue) > self.max_queued:
+            self._queue.remove(ticket)
+            STREAMS_QUEUED.set(len(self._queue))
+            ADMISSION_REJECTED.inc()
+            raise Overloaded(f"{self.max_queued} chat requests already waiting")
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based place in line, or 0 once admitted"""
+        return 0 if ticket.admitted else self._queue.index(ticket) + 1
+
+    async def wait(self, ticket: Ticket) -> AsyncIterator[int]:
+        """Yield the ticket's place in line whenever it changes, until it is admitted"""
+        last = None
+        while not ticket.admitted:
+            position = self.position(ticket)
+            if position != last:
+                last = position
+                yield position
+            await ticket._changed.wait()
+            ticket._changed.clear()
+
+    def release(self, ticket: Ticket) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.admitted:
+            self._active -= 1
+            if ticket.user_id is not None:
+                self._per_user[ticket.user_id] -= 1
+                if not self._per_user[ticket.user_id]:
+                    del self._per_user[ticket.user_id]
+        elif ticket in self._queue:
+            self._queue.remove(ticket)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        for ticket in list(self._queue):
+            if self._active >= self.max_active:
+                break
+            if self._can_run(ticket.user_id):
+                self._queue.remove(ticket)
+                self._admit(ticket)
+                ticket._changed.set()
+        STREAMS_QUEUED.set(len(self._queue))
+        self._notify()
+
+    def _notify(self) -> None:
+        for ticket in self._queue:
+            ticket._changed.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "queued": len(self._queue),
+            "max_active": self.max_active,
+            "max_per_user": self.max_per_user,
+            "max_queued": self.max_queued,
+        }
+
+
+admission = AdmissionController()
+
+
+async def admitted_stream(ticket: Ticket, frames: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Report queue position as transient SSE events, then relay frames; the slot
+    is freed at the end. A stream that never starts does not free it, so the
+    response releases the ticket too (release is idempotent).
+    """
+    try:
+        async for position in admission.wait(ticket):
+            yield frame({"type": "data-queue-position", "data": {"position": position}, "transient": True})
+        async for chunk in frames:
+            yield chunk
+    finally:
+        admission.release(ticket)
+
+
+async def cancel_on_disconnect(
+    receive: Callable[[], Awaitable[Dict[str, Any]]],
+    frames: AsyncIterator[bytes],
+) -> AsyncIterator[bytes]:
+    """
+    Relay frames until the client disconnects, then cancel the producer at
+    whatever it is awaiting (queue slot, file fetches or the model stream)
+    rather than waiting for the next write to fail.
+    """
+    async def watch() -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    watcher = asyncio.ensure_future(watch())
+    iterator = frames.__aiter__()
+    pending = None
+    try:
+        while True:
+            pending = asyncio.ensure_future(iterator.__anext__())
+            await asyncio.wait({pending, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not pending.done():
+                logger.info("Client disconnected, chat stream cancelled")
+                return
+            try:
+                chunk = pending.result()
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        watcher.cancel()
+        if pending is not None and not pending.done():
+            # The producer's own finally blocks release its slot and stop the run
+            pending.cancel()
+        else:
+            await iterator.aclose()
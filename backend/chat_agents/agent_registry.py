@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from agents import Agent, CodeInterpreterTool, WebSearchTool
+
+
+logger = logging.getLogger(__name__)
+
+CHAT_INSTRUCTIONS = "You are a healthcare and Data Analyst Assistant for Kaiser Permanente. Use web_search for current facts and cite sources. If the user uploads CSV/Excel and asks for analysis of it, call 'analyze_datasets' with the full request. Be concise."
+
+DEFAULT_CHAT_MODEL = os.getenv("ATLAS_DEFAULT_MODEL", "gpt-4.1")
+
+# selectedChatModel ids sent by the frontend -> OpenAI model names
+MODEL_ALIASES: Dict[str, str] = {
+    "chat-model": "gpt-4.1",
+    **json.loads(os.getenv("ATLAS_MODEL_ALIASES", "{}")),
+}
+
+DEFAULT_TOOLS: Tuple[str, ...] = ("web_search", "code_interpreter", "analyze_datasets")
+
+# Unknown ids remembered so each is warned about once; bounded since ids come from clients
+MAX_WARNED_MODEL_IDS = 256
+
+
+def _build_tool(name: str) -> Any:
+    if name == "web_search":
+        return WebSearchTool()
+    if name == "code_interpreter":
+        return CodeInterpreterTool(
+            tool_config={"type": "code_interpreter", "container": {"type": "auto"}}
+        )
+    if name == "analyze_datasets":
+        # Deferred: the data analyst modules are only needed once the tool is built
+        from .data_analyst_agent.data_analyst_main import analyze_datasets
+        return analyze_datasets
+    raise ValueError(f"Unknown tool: {name}")
+
+
+class ChatContext(NamedTuple):
+    """Run context of a chat turn, read by tools such as analyze_datasets"""
+    session_id: Optional[str] = None
+
+
+class AgentRegistry:
+    """
+    Agents built once and reused across requests, keyed by model and tool set.
+    Agent objects are immutable configuration, so sharing them between
+    concurrent runs is safe; tools are likewise built once and shared.
+    """
+
+    def __init__(self, aliases: Dict[str, str] = MODEL_ALIASES, default_model: str = DEFAULT_CHAT_MODEL):
+        self.aliases = aliases
+        self.default_model = default_model
+        self._agents: Dict[Tuple[str, Tuple[str, ...]], Agent] = {}
+        self._tools: Dict[str, Any] = {}
+        self._warned: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def resolve_model(self, selected_chat_model: str | None) -> str:
+        if selected_chat_model in self.aliases:
+            return self.aliases[selected_chat_model]
+        if selected_chat_model and selected_chat_model not in self._warned and len(self._warned) < MAX_WARNED_MODEL_IDS:
+            self._warned.add(selected_chat_model)
+            logger.warning(f"Unknown selectedChatModel '{selected_chat_model}', using {self.default_model}")
+        return self.default_model
+
+    def get(self, selected_chat_model: str | None, tools: Iterable[str] = DEFAULT_TOOLS) -> Agent:
+        model = self.resolve_model(selected_chat_model)
+        key = (model, tuple(tools))
+
+        agent = self._agents.get(key)
+        if agent is not None:
+            return agent
+
+        with self._lock:
+            agent = self._agents.get(key)
+            if agent is None:
+                agent = Agent(
+                    name="agent",
+                    model=model,
+                    instructions=CHAT_INSTRUCTIONS,
+                    tools=[self._tool(name) for name in key[1]],
+                )
+                self._agents[key] = agent
+            return agent
+
+    def _tool(self, name: str) -> Any:
+        tool = self._tools.get(name)
+        if tool is None:
+            tool = self._tools[name] = _build_tool(name)
+        return tool
+
+    def warm(self) -> None:
+        """Build the agent for every known model alias with the default tools"""
+        for alias in self.aliases:
+            self.get(alias)
+
+
+agent_registry = AgentRegistry()
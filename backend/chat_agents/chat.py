@@ -1,92 +1,346 @@
-import json 
+import asyncio
 import time
 import logging 
 import os
 import re
-import requests
-from io import BytesIO
-from typing import List, Any, Dict, AsyncIterator
+from typing import List, Any, Dict, AsyncIterator, Awaitable, Callable
 from dotenv import load_dotenv
-from agents import Agent, Runner, WebSearchTool, CodeInterpreterTool
-import PyPDF2
-import pandas as pd
+from agents import Runner
+
+from .agent_registry import ChatContext, agent_registry
+from .context_budget import (
+    ContextMessage, ContextSegment, budget_for, context_store, count_tokens, fit_to_budget, message_key,
+)
+from .dataset_store import dataset_store
+from .file_cache import file_cache, make_cache_key
+from .file_fetch import Download, DownloadBudget, check_file_size, download, fetch_file_info
+from .ingestion import IngestJob, ingestion
+from .metrics import FILE_EXTRACTION, RESPONSE_CACHE, STREAM_DURATION, STREAMS_CANCELLED, RunMetrics
+from .response_cache import needs_fresh_answer, replay_frames, response_cache, response_cache_key
+from .sse import (
+    DeltaCoalescer, IDLE, START_STEP, TEXT_START, TEXT_END, END_STEP,
+    frame, error_frame, with_deadline,
+)
+from .stream_events import text_delta, ERROR_EVENT_TYPES
+from .pdf_extraction import extract_pdf, PDF_MAX_PAGES, PDF_MAX_CHARS
+from .profiling import request_stage
 
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-def extract_pdf_text(url: str) -> str:
-    """Extract text from PDF file"""
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+async def resolve_file_key(
+    kind: str,
+    url: str,
+    downloads: DownloadBudget | None = None,
+    prefix: bool = False,
+) -> tuple[str, Download | None]:
+    """
+    Compute the content-addressed key for a file.
+    Keys are the URL plus the server's ETag, or a hash of the file computed
+    while it downloads when no ETag is available (in which case the download
+    is returned too, and the caller closes it). Unless prefix is set, a file
+    whose announced size is over the cap is rejected before downloading it.
+    """
+    etag, size = await fetch_file_info(url)
+    if not prefix:
+        check_file_size(size)
+    if etag:
+        return make_cache_key(kind, url, etag), None
+
+    fetched = await download(url, downloads, prefix=prefix)
+    return make_cache_key(kind, url, fetched.digest), fetched
+
+async def extract_cached(
+    kind: str,
+    url: str,
+    parse: Callable[[bytes | str], Awaitable[str]],
+    downloads: DownloadBudget | None = None,
+) -> str:
+    """
+    Return extracted file text, consulting the file cache first. parse gets
+    the file's bytes, or the temp file path when the download spilled to disk.
+    """
+    key, fetched = await resolve_file_key(kind, url, downloads)
+    try:
+        cached = await asyncio.to_thread(file_cache.get, key)
+        if cached is not None:
+            return cached
+
+        if fetched is None:
+            fetched = await download(url, downloads)
+        text = await parse(fetched.source)
+        await asyncio.to_thread(file_cache.put, key, text)
+        return text
+    finally:
+        if fetched is not None:
+            fetched.close()
+
+async def _pdf_text(
+    url: str,
+    on_progress: ProgressCallback | None = None,
+    downloads: DownloadBudget | None = None,
+) -> str:
+    return await extract_cached(
+        f"pdf:{PDF_MAX_PAGES}:{PDF_MAX_CHARS}",
+        url,
+        lambda source: extract_pdf(source, on_progress=on_progress),
+        downloads,
+    )
+
+async def ingested_result(media_type: str, url: str, on_progress: ProgressCallback | None = None) -> Any:
+    """
+    The upload-time ingestion job's result for an attachment, waiting for it
+    if it is still running. None if there is no job or it failed, in which
+    case the caller extracts the file itself.
+    """
+    job = ingestion.lookup(media_type, url)
+    if job is None:
+        return None
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        pdf_file = BytesIO(response.content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-            
-        return text.strip()
+        return await ingestion.wait(job, on_progress)
+    except RuntimeError as e:
+        logger.warning(f"Ingestion of {job.filename} failed, extracting it inline: {e}")
+        return None
+
+async def extract_pdf_text(
+    url: str,
+    on_progress: ProgressCallback | None = None,
+    downloads: DownloadBudget | None = None,
+) -> str:
+    """Extract text from PDF file, or take it from the upload-time ingestion job"""
+    try:
+        text = await ingested_result(PDF_MEDIA_TYPE, url, on_progress)
+        if text is not None:
+            return text
+        return await _pdf_text(url, on_progress, downloads)
     except Exception as e:
         logger.error(f"Error extracting PDF text: {e}")
         return f"[Error reading PDF: {str(e)}]"
 
-def extract_excel_data(url: str) -> str:
-    """Extract data from Excel file"""
+async def ingest_dataset(
+    url: str,
+    filename: str,
+    media_type: str,
+    downloads: DownloadBudget | None = None,
+) -> str:
+    """Ingest a CSV/Excel file into the dataset store (once per content) and return its dataset id"""
+    # A CSV over the size cap is loaded from its first rows rather than rejected;
+    # a cut Excel file cannot be opened, so those are rejected
+    prefix = media_type == 'text/csv'
+    dataset_id, fetched = await resolve_file_key("dataset", url, downloads, prefix=prefix)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        excel_file = BytesIO(response.content)
-        
-        # Try reading as Excel first
-        try:
-            df = pd.read_excel(excel_file)
-        except:
-            # If Excel fails, try CSV
-            excel_file.seek(0)
-            df = pd.read_csv(excel_file)
-        
-        # Convert to string representation
-        return df.to_string(max_rows=100)  # Limit rows to avoid huge output
+        if not await asyncio.to_thread(dataset_store.exists, dataset_id):
+            if fetched is None:
+                fetched = await download(url, downloads, prefix=prefix)
+            # Parsing is CPU-bound, keep it off the event loop
+            await asyncio.to_thread(
+                dataset_store.ingest, dataset_id, filename, fetched.source, media_type, fetched.truncated
+            )
+    finally:
+        if fetched is not None:
+            fetched.close()
+    return dataset_id
+
+async def extract_excel_data(
+    url: str,
+    filename: str,
+    media_type: str,
+    session_id: str | None = None,
+    downloads: DownloadBudget | None = None,
+) -> str:
+    """
+    Ingest a CSV/Excel file into the dataset store, or take it from the
+    upload-time ingestion job, and return its schema and statistics summary
+    for the prompt
+    """
+    try:
+        dataset_id = await ingested_result(media_type, url)
+        if dataset_id is None:
+            dataset_id = await ingest_dataset(url, filename, media_type, downloads)
+
+        if session_id:
+            await asyncio.to_thread(dataset_store.attach, session_id, filename, dataset_id)
+
+        return await asyncio.to_thread(dataset_store.describe, dataset_id)
     except Exception as e:
         logger.error(f"Error extracting Excel/CSV data: {e}")
         return f"[Error reading Excel/CSV: {str(e)}]"
 
-def process_file_content(content: str) -> str:
-    """Process message content and extract file contents"""
-    # Pattern to match file references: [File: filename (mediaType) - URL: url]
-    file_pattern = r'\[File: ([^(]+) \(([^)]+)\) - URL: ([^\]]+)\]'
-    
-    def replace_file_ref(match):
-        filename = match.group(1).strip()
-        media_type = match.group(2).strip()
-        url = match.group(3).strip()
-        
-        if media_type == 'application/pdf':
-            file_content = extract_pdf_text(url)
-            return f"[PDF File: {filename}]\n{file_content}\n[End of PDF]"
-        elif media_type in ['text/csv', 'application/vnd.ms-excel', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet']:
-            file_content = extract_excel_data(url)
-            return f"[Excel/CSV File: {filename}]\n{file_content}\n[End of Excel/CSV]"
-        else:
-            return f"[File: {filename} ({media_type}) - Content not processed]"
-    
-    return re.sub(file_pattern, replace_file_ref, content)
+# Pattern to match file references: [File: filename (mediaType) - URL: url]
+FILE_PATTERN = re.compile(r'\[File: ([^(]+) \(([^)]+)\) - URL: ([^\]]+)\]')
+
+PDF_MEDIA_TYPE = 'application/pdf'
+EXCEL_MEDIA_TYPES = ['text/csv', 'application/vnd.ms-excel', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet']
+
+def media_label(media_type: str) -> str:
+    """Metric label for an attachment's media type; the media type itself is client-supplied and unbounded"""
+    if media_type == PDF_MEDIA_TYPE:
+        return "pdf"
+    if media_type == 'text/csv':
+        return "csv"
+    if media_type in EXCEL_MEDIA_TYPES:
+        return "spreadsheet"
+    return "other"
+
+async def render_file_ref(
+    match: re.Match,
+    on_progress: ProgressCallback | None = None,
+    session_id: str | None = None,
+    downloads: DownloadBudget | None = None,
+) -> str:
+    """Replace a single file reference with its extracted contents"""
+    filename = match.group(1).strip()
+    media_type = match.group(2).strip()
+    url = match.group(3).strip()
+
+    with FILE_EXTRACTION.labels(media_label(media_type)).time():
+        return await _render_file(filename, media_type, url, on_progress, session_id, downloads)
+
+async def _render_file(
+    filename: str,
+    media_type: str,
+    url: str,
+    on_progress: ProgressCallback | None,
+    session_id: str | None,
+    downloads: DownloadBudget | None,
+) -> str:
+    if media_type == PDF_MEDIA_TYPE:
+        page_progress = None
+        if on_progress:
+            page_progress = lambda done, total: on_progress(
+                {"file": filename, "mediaType": media_type, "pagesDone": done, "pagesTotal": total}
+            )
+        file_content = await extract_pdf_text(url, on_progress=page_progress, downloads=downloads)
+        return f"[PDF File: {filename}]\n{file_content}\n[End of PDF]"
+    elif media_type in EXCEL_MEDIA_TYPES:
+        file_content = await extract_excel_data(url, filename, media_type, session_id, downloads)
+        return f"[Excel/CSV File: {filename}]\n{file_content}\n[End of Excel/CSV]"
+    else:
+        return f"[File: {filename} ({media_type}) - Content not processed]"
+
+def _sheet_status(dataset_id: str) -> Dict[str, Any]:
+    sheets = dataset_store.manifest(dataset_id)["sheets"]
+    return {"sheets": [{"name": s["name"], "rows": s["rows"], "columns": len(s["columns"])} for s in sheets]}
+
+def start_ingestion(filename: str, media_type: str, url: str) -> IngestJob:
+    """
+    Start extracting an uploaded attachment in the background (PDF text, or a
+    spreadsheet's schema, statistics and sample rows) so the chat turn that
+    references it finds the work done or in progress. Raises ValueError for
+    media types that are not extracted and IngestionBusy when too many jobs run.
+    """
+    if media_type == PDF_MEDIA_TYPE:
+        async def run(job: IngestJob) -> str:
+            with request_stage("ingest_pdf"):
+                return await _pdf_text(url, job.report, DownloadBudget())
+    elif media_type in EXCEL_MEDIA_TYPES:
+        async def run(job: IngestJob) -> str:
+            with request_stage("ingest_dataset"):
+                dataset_id = await ingest_dataset(url, filename, media_type, DownloadBudget())
+                job.detail = await asyncio.to_thread(_sheet_status, dataset_id)
+                return dataset_id
+    else:
+        raise ValueError(f"Attachments of type {media_type} are not extracted")
+    return ingestion.start(filename, media_type, url, run)
 
+async def process_file_segments(
+    content: str,
+    on_progress: ProgressCallback | None = None,
+    session_id: str | None = None,
+    downloads: DownloadBudget | None = None,
+) -> List[tuple[str, str | None]]:
+    """
+    Split message content into (text, filename) segments with file references
+    replaced by their extracted contents, fetching all files concurrently
+    """
+    matches = list(FILE_PATTERN.finditer(content))
+    if not matches:
+        return [(content, None)]
 
+    replacements = await asyncio.gather(*(render_file_ref(m, on_progress, session_id, downloads) for m in matches))
+
+    segments = []
+    last = 0
+    for match, replacement in zip(matches, replacements):
+        segments.append((content[last:match.start()], None))
+        segments.append((replacement, match.group(1).strip()))
+        last = match.end()
+    segments.append((content[last:], None))
+
+    return segments
+
+async def process_file_content(
+    content: str,
+    on_progress: ProgressCallback | None = None,
+    session_id: str | None = None,
+    downloads: DownloadBudget | None = None,
+) -> str:
+    """Process message content and extract file contents, fetching all files concurrently"""
+    segments = await process_file_segments(content, on_progress, session_id, downloads)
+    return "".join(text for text, _ in segments)
+
+async def build_context_message(
+    message: Dict[str, Any],
+    key: str,
+    model: str | None,
+    on_progress: ProgressCallback | None = None,
+    session_id: str | None = None,
+    downloads: DownloadBudget | None = None,
+) -> ContextMessage:
+    """Extract a message's attachments and count its tokens"""
+    segments = await process_file_segments(str(message.get("content", "")), on_progress, session_id, downloads)
+    # Tokenizing a long extracted document is CPU-bound, keep it off the event loop
+    counted = await asyncio.to_thread(
+        lambda: [ContextSegment(text, filename, count_tokens(text, model)) for text, filename in segments if text]
+    )
+    # Failed extractions are retried on the next turn instead of being remembered
+    cacheable = not any(s.filename and "[Error reading" in s.text for s in counted)
+    return ContextMessage(key, message.get("role", "user").lower(), counted, cacheable)
+
+async def to_agent_messages(
+    history: List[Dict[str, Any]],
+    on_progress: ProgressCallback | None = None,
+    session_id: str | None = None,
+    selected_chat_model: str | None = None,
+):
+    """
+    Convert chat history into agent input within the model's token budget.
+    Messages already processed for this conversation are reused, so a turn
+    only extracts attachments and counts tokens for new messages.
+    """
+    model = agent_registry.resolve_model(selected_chat_model) if selected_chat_model else None
+    known = context_store.get(session_id) if session_id else {}
+
+    keys = [message_key(m) for m in history]
+    fresh = [i for i, key in enumerate(keys) if key not in known]
+    # Process every new message at once so all attachments download in parallel,
+    # within one size budget for the whole request
+    downloads = DownloadBudget()
+    with request_stage("extract_files"):
+        built = await asyncio.gather(
+            *(build_context_message(history[i], keys[i], model, on_progress, session_id, downloads) for i in fresh)
+        )
+    built_by_index = dict(zip(fresh, built))
+    context = [built_by_index[i] if i in built_by_index else known[key] for i, key in enumerate(keys)]
+    if session_id:
+        context_store.put(session_id, context)
+
+    query = next(
+        (FILE_PATTERN.sub("", str(m.get("content", ""))) for m in reversed(history) if m.get("role", "user").lower() == "user"),
+        "",
+    )
+    with request_stage("fit_context"):
+        texts = await asyncio.to_thread(fit_to_budget, context, budget_for(selected_chat_model, model), query, model)
 
-def to_agent_messages(history: List[Dict[str, Any]]):
     msgs = []
-    for m in history:
-        role = m.get("role", "user").lower()
-        text = str(m.get("content", ""))
-        
-        # Process file content if present
-        processed_text = process_file_content(text)
+    for entry, processed_text in zip(context, texts):
+        if processed_text is None:
+            continue
+        role = entry.role
 
         if role == "system":
             msgs.append({"content": processed_text, "role": "developer", "type": "message"})
@@ -100,61 +354,115 @@ def to_agent_messages(history: List[Dict[str, Any]]):
 async def stream_chat_py(
     messages: List[Dict[str, Any]],
     selected_chat_mode: str,
-    request_hints: Dict[str, Any] | None 
-) -> AsyncIterator[str]:
+    request_hints: Dict[str, Any] | None,
+    chat_id: str | None = None,
+) -> AsyncIterator[bytes]:
 
-    start_time = time.time()
+    start_time = time.perf_counter()
 
-    code_tool = CodeInterpreterTool(
-        tool_config={"type": "code_interpreter", "container": {"type": "auto"}}
-    )
-
-    agent = Agent(
-        name="agent",
-        model="gpt-4.1",
-        instructions="You are a healthcare and Data Analyst Assistant for Kaiser Permanente. Use web_search for current facts and cite sources. If the user uploads CSV/Excel and asks for analysis, you will call 'CodeInterpreterTool'. Be concise.",
-        tools=[
-            WebSearchTool(), 
-            code_tool
-        ]
-    )
+    agent = agent_registry.get(selected_chat_mode)
+    run_metrics = RunMetrics(agent.model, start_time)
 
-    agent_input = to_agent_messages(messages)
+    # Attachments and questions about current events always get a live run
+    cache_key = None
+    if response_cache.enabled:
+        if any(FILE_PATTERN.search(str(m.get("content", ""))) for m in messages) or needs_fresh_answer(messages):
+            RESPONSE_CACHE.labels("bypass").inc()
+        else:
+            tools = tuple(getattr(t, "name", type(t).__name__) for t in agent.tools)
+            cache_key = response_cache_key(messages, agent.model, agent.instructions, tools)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                RESPONSE_CACHE.labels("hit").inc()
+                for chunk in replay_frames(cached):
+                    yield chunk
+                STREAM_DURATION.observe(time.perf_counter() - start_time)
+                return
+            RESPONSE_CACHE.labels("miss").inc()
+    answer = []
 
     # Prologue 
-    yield f"data: {json.dumps({"type": "start-step"})}\n\n"
-    yield f"data: {json.dumps({"type": "text-start"})}\n\n"
+    yield START_STEP
+
+    # Extract attachments in the background and relay page progress while it runs
+    progress: asyncio.Queue = asyncio.Queue()
+    extraction = asyncio.create_task(
+        to_agent_messages(messages, on_progress=progress.put_nowait, session_id=chat_id, selected_chat_model=selected_chat_mode)
+    )
+    try:
+        while not extraction.done():
+            getter = asyncio.ensure_future(progress.get())
+            await asyncio.wait({getter, extraction}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield frame({"type": "data-file-progress", "data": getter.result(), "transient": True})
+            else:
+                getter.cancel()
+        while not progress.empty():
+            yield frame({"type": "data-file-progress", "data": progress.get_nowait(), "transient": True})
+        agent_input = extraction.result()
+    finally:
+        extraction.cancel()
+
+    yield TEXT_START
 
+    streamed = None
+    finished = False
     try: 
-        streamed = Runner.run_streamed(agent, input=agent_input)
-
-        async for ev in streamed.stream_events():
-            et = getattr(ev, "type", "")
-
-            # Handle raw_response_event with ResponseTextDeltaEvent
-            if et == "raw_response_event":
-                data = getattr(ev, "data", None)
-                if data and hasattr(data, '__class__') and 'ResponseTextDeltaEvent' in str(data.__class__):
-                    delta = getattr(data, "delta", "")
-                    if delta:
-                        yield f"data: {json.dumps({"type": "text-delta", "delta": delta})}\n\n"
-
-            elif et in ("text.delta", "response.text.delta", "agent.output_text.delta"):
-                chunk = getattr(ev, "delta", None) or getattr(ev, "text", "")
-                if chunk: 
-                    yield f"data: {json.dumps({"type": "text-delta", "delta": chunk})}\n\n"
-
-            elif et in ("error", "agent.error", "run.error"):
-                msg = str(getattr(ev, "error", "unknown_error"))
-                yield f"data: {json.dumps({"type": "error", "message": msg})}\n\n"
-                
-        yield f"data: {json.dumps({"type": "text-end"})}\n\n"
-        yield f"data: {json.dumps({"type": "end-step"})}\n\n"
+        run_metrics.run_started()
+        streamed = Runner.run_streamed(agent, input=agent_input, context=ChatContext(chat_id))
+
+        # Coalesce token deltas into fewer, larger frames (time or size window)
+        coalescer = DeltaCoalescer()
+        with request_stage("agent_run"):
+            async for ev in with_deadline(streamed.stream_events(), coalescer.remaining):
+                if ev is IDLE:
+                    pending = coalescer.flush()
+                    if pending:
+                        yield pending
+                    continue
+
+                et = getattr(ev, "type", "")
+                run_metrics.event(ev)
+
+                delta = text_delta(ev)
+                if delta:
+                    run_metrics.text_delta()
+                    if cache_key:
+                        answer.append(delta)
+                    ready = coalescer.add(delta)
+                    if ready:
+                        yield ready
+
+                elif et in ERROR_EVENT_TYPES:
+                    pending = coalescer.flush()
+                    if pending:
+                        yield pending
+                    msg = str(getattr(ev, "error", "unknown_error"))
+                    yield error_frame(msg)
+                    cache_key = None
+
+        pending = coalescer.flush()
+        if pending:
+            yield pending
+        finished = True
+        run_metrics.run_finished()
+        # Answers grounded in a web search are not reused
+        if cache_key and answer and not run_metrics.used_tool("web_search_call"):
+            response_cache.put(cache_key, "".join(answer))
+        yield TEXT_END
+        yield END_STEP
+
+    except (asyncio.CancelledError, GeneratorExit):
+        STREAMS_CANCELLED.inc()
+        raise
 
     except Exception as e:
-        yield f"data: {json.dumps({"type": "error", "message": str(e)})}\n\n"
+        yield error_frame(str(e))
 
     finally: 
-        end_time = time.time()
+        # Stop the upstream run (and its tool calls) if the client went away mid-stream
+        if streamed is not None and not finished:
+            streamed.cancel()
+        end_time = time.perf_counter()
         duration = end_time - start_time
-    
\ No newline at end of file
+        STREAM_DURATION.observe(duration)
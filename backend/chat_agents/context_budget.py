@@ -0,0 +1,268 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Prompt budgets are well below the models' context windows: past this point
+# extra history mostly adds latency and cost
+CONTEXT_BUDGET_TOKENS = int(os.getenv("ATLAS_CONTEXT_BUDGET_TOKENS", "64000"))
+# selectedChatModel ids or model names -> token budget
+CONTEXT_BUDGETS: Dict[str, int] = json.loads(os.getenv("ATLAS_CONTEXT_BUDGETS", "{}"))
+CONTEXT_EXCERPT_TOKENS = int(os.getenv("ATLAS_CONTEXT_EXCERPT_TOKENS", "2000"))
+CONTEXT_SESSIONS = int(os.getenv("ATLAS_CONTEXT_SESSIONS", "256"))
+
+MESSAGE_OVERHEAD_TOKENS = 4
+CHUNK_CHARS = 1600
+
+_WORD = re.compile(r"[a-z0-9_]{3,}")
+
+
+# --- token counting ---
+
+_encodings: Dict[str, object] = {}
+_encodings_lock = threading.Lock()
+
+
+def _encoding(model: Optional[str]):
+    """tiktoken encoding for model, or None when tiktoken or its BPE files are unavailable"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        name = tiktoken.encoding_name_for_model(model or "")
+    except KeyError:
+        name = "o200k_base"
+    if name in _encodings:
+        return _encodings[name]
+
+    with _encodings_lock:
+        if name not in _encodings:
+            try:
+                # May download the BPE file on first use; cached after that
+                _encodings[name] = tiktoken.get_encoding(name)
+            except Exception as e:
+                logger.warning(f"Tokenizer {name} unavailable, estimating token counts: {e}")
+                _encodings[name] = None
+        return _encodings[name]
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    enc = _encoding(model)
+    if enc is None:
+        # Roughly four characters per token for English prose
+        return (len(text) + 3) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def budget_for(selected_chat_model: Optional[str], model: Optional[str]) -> int:
+    for key in (selected_chat_model, model):
+        if key and key in CONTEXT_BUDGETS:
+            return int(CONTEXT_BUDGETS[key])
+    return CONTEXT_BUDGET_TOKENS
+
+
+# --- processed messages ---
+
+class ContextSegment:
+    """A piece of message text; filename is set when it is an extracted file body"""
+
+    __slots__ = ("text", "filename", "tokens", "_chunks")
+
+    def __init__(self, text: str, filename: Optional[str], tokens: int):
+        self.text = text
+        self.filename = filename
+        self.tokens = tokens
+        self._chunks = None
+
+    @property
+    def is_file_body(self) -> bool:
+        return self.filename is not None and self.text.count("\n") >= 2
+
+    def chunks(self, model: Optional[str]) -> List[tuple]:
+        """Split the body (between the header and footer lines) into (text, tokens) chunks, once"""
+        if self._chunks is None:
+            body = self.text.split("\n")[1:-1]
+            chunks, current, size = [], [], 0
+            for line in body:
+                current.append(line)
+                size += len(line) + 1
+                if size >= CHUNK_CHARS:
+                    chunks.append("\n".join(current))
+                    current, size = [], 0
+            if current:
+                chunks.append("\n".join(current))
+            self._chunks = [(chunk, count_tokens(chunk, model)) for chunk in chunks]
+        return self._chunks
+
+
+class ContextMessage:
+    """A history message after file extraction, with token counts computed once"""
+
+    __slots__ = ("key", "role", "segments", "cacheable")
+
+    def __init__(self, key: str, role: str, segments: List[ContextSegment], cacheable: bool = True):
+        self.key = key
+        self.role = role
+        self.segments = segments
+        self.cacheable = cacheable
+
+    @property
+    def tokens(self) -> int:
+        return MESSAGE_OVERHEAD_TOKENS + sum(s.tokens for s in self.segments)
+
+    @property
+    def text(self) -> str:
+        return "".join(s.text for s in self.segments)
+
+
+def message_key(message: Dict) -> str:
+    raw = f"{message.get('role', 'user')}\0{message.get('content', '')}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class ContextStore:
+    """
+    Processed messages per conversation, so each turn only extracts and counts
+    tokens for messages it has not seen. Conversations are evicted LRU.
+    """
+
+    def __init__(self, max_sessions: int = CONTEXT_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict[str, ContextMessage]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Dict[str, ContextMessage]:
+        with self._lock:
+            messages = self._sessions.get(session_id)
+            if messages is None:
+                return {}
+            self._sessions.move_to_end(session_id)
+            return messages
+
+    def put(self, session_id: str, messages: List[ContextMessage]) -> None:
+        with self._lock:
+            self._sessions[session_id] = {m.key: m for m in messages if m.cacheable}
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+
+context_store = ContextStore()
+
+
+# --- budgeting ---
+
+def _terms(text: str) -> set:
+    return set(_WORD.findall(text.lower()))
+
+
+def excerpt(segment: ContextSegment, max_tokens: int, query: set, model: Optional[str]) -> str:
+    """
+    Keep the chunks of a file body most relevant to the query (plus the first,
+    which holds schema/summary lines) within max_tokens, in document order
+    """
+    lines = segment.text.split("\n")
+    header, footer = lines[0], lines[-1]
+    chunks = segment.chunks(model)
+
+    ranked = sorted(
+        range(len(chunks)),
+        key=lambda i: (i != 0, -len(query & _terms(chunks[i][0])), i),
+    )
+    kept, used = [], 0
+    for i in ranked:
+        if used + chunks[i][1] > max_tokens:
+            continue
+        kept.append(i)
+        used += chunks[i][1]
+    kept.sort()
+
+    parts = [header]
+    previous = -1
+    for i in kept:
+        if i != previous + 1:
+            parts.append("[...]")
+        parts.append(chunks[i][0])
+        previous = i
+    if previous != len(chunks) - 1:
+        parts.append("[...]")
+    parts.append(f"[Excerpt: {len(kept)} of {len(chunks)} sections of {segment.filename} kept to fit the context budget]")
+    parts.append(footer)
+    return "\n".join(parts)
+
+
+def omit(segment: ContextSegment) -> str:
+    lines = segment.text.split("\n")
+    return f"{lines[0]}\n[Content of {segment.filename} omitted to fit the context budget]\n{lines[-1]}"
+
+
+def fit_to_budget(
+    messages: List[ContextMessage],
+    budget: int,
+    query: str,
+    model: Optional[str] = None,
+) -> List[Optional[str]]:
+    """
+    Render messages within budget tokens. Older file bodies are reduced to
+    relevant excerpts first, then omitted, then older messages are dropped
+    (None); the latest message is kept and only its file bodies are excerpted.
+    """
+    total = sum(m.tokens for m in messages)
+    if total <= budget or not messages:
+        return [m.text for m in messages]
+
+    original = total
+    terms = _terms(query)
+    # Per message, per segment: replacement text and its tokens (None = unchanged)
+    rendered: List[List[Optional[tuple]]] = [[None] * len(m.segments) for m in messages]
+    dropped = [False] * len(messages)
+    older = range(len(messages) - 1)
+
+    def replace(mi: int, si: int, text: str) -> None:
+        nonlocal total
+        segment = messages[mi].segments[si]
+        current = rendered[mi][si][1] if rendered[mi][si] else segment.tokens
+        tokens = count_tokens(text, model)
+        if tokens < current:
+            rendered[mi][si] = (text, tokens)
+            total -= current - tokens
+
+    for reduce in (lambda s: excerpt(s, CONTEXT_EXCERPT_TOKENS, terms, model), omit):
+        for mi in older:
+            for si, segment in enumerate(messages[mi].segments):
+                if total <= budget:
+                    break
+                if segment.is_file_body:
+                    replace(mi, si, reduce(segment))
+
+    for mi in older:
+        if total <= budget:
+            break
+        if messages[mi].role == "system":
+            continue
+        total -= MESSAGE_OVERHEAD_TOKENS + sum(
+            r[1] if r else s.tokens for r, s in zip(rendered[mi], messages[mi].segments)
+        )
+        dropped[mi] = True
+
+    last = len(messages) - 1
+    files = [si for si, s in enumerate(messages[last].segments) if s.is_file_body]
+    if total > budget and files:
+        per_file = max(0, (budget - (total - sum(messages[last].segments[si].tokens for si in files))) // len(files))
+        for si in files:
+            replace(last, si, excerpt(messages[last].segments[si], per_file, terms, model))
+
+    logger.info(f"Context trimmed from {original} to {total} tokens (budget {budget}), dropped {sum(dropped)} messages")
+    return [
+        None if dropped[mi] else "".join(r[0] if r else s.text for r, s in zip(rendered[mi], m.segments))
+        for mi, m in enumerate(messages)
+    ]
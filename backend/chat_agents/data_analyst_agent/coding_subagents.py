@@ -1,15 +1,231 @@
-from openai import OpenAI
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
 from agents import Agent, Runner
-import numpy as np
-import pandas as pd
-import sklearn 
+
+from ..stream_events import text_deltas
+from .planner import DATA_ANALYST_MODEL, PlanStep
+from .utils import IncrementalPythonExtractor, execute_code, extract_json
 
 """
-ReAct based data scientist agent 
+ReAct based data scientist agent
 
-Newer models are smarter, so a single coding agent could handle more tasks in one given go. 
+Newer models are smarter, so a single coding agent could handle more tasks in one given go.
 But now this will be react based so it will look over the last iteration and decide if that is enought to answer
-user prompt or if it should keep going. 
+user prompt or if it should keep going.
 """
 
-# first buid the orchestrator agent 
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+MAX_STEP_ITERATIONS = int(os.getenv("ATLAS_ANALYSIS_MAX_ITERATIONS", "4"))
+STEP_MEMO_ENTRIES = int(os.getenv("ATLAS_ANALYSIS_MEMO_ENTRIES", "1024"))
+OBSERVATION_CHARS = 4000
+
+CODING_INSTRUCTIONS = """You are a data scientist answering one analysis question with Python.
+The datasets are in a dict named `dataframes` (file name -> DataFrame, or file name -> {sheet name -> DataFrame}),
+and results of earlier steps are in a dict named `results` (step id -> value).
+
+Each turn, either:
+- reply with one ```python block that defines main() and returns the values you need to see, or
+- once the last result answers the question, reply with JSON only: {"final_answer": "..."}
+
+Do not print large tables; return compact values (numbers, small dicts, short lists)."""
+
+coding_agent = Agent(
+    name="data_analyst_coder",
+    model=DATA_ANALYST_MODEL,
+    instructions=CODING_INSTRUCTIONS,
+)
+
+
+class StepResult(NamedTuple):
+    step_id: str
+    answer: str
+    result: Any
+    code: Optional[str]
+    success: bool
+    iterations: int
+
+
+class StepMemo:
+    """
+    Successful code results keyed by code hash, dataset versions and step inputs.
+    Dataset ids are content-addressed, so a new upload is a new version and never
+    hits a stale entry. Bounded LRU; safe to share between concurrent steps.
+    """
+
+    def __init__(self, max_entries: int = STEP_MEMO_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+step_memo = StepMemo()
+
+
+def _fingerprint(value: Any, digest: Any) -> bool:
+    """
+    Feed a stable hash of a step result into digest. repr() is not stable:
+    pandas and numpy truncate large objects, so different data could share a key.
+    Returns False for values without a stable hash.
+    """
+    import numpy as np
+    import pandas as pd
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+        digest.update(f"{type(value).__name__}:{value!r}\0".encode("utf-8"))
+        return True
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        try:
+            rows = pd.util.hash_pandas_object(value, index=True).to_numpy()
+        except TypeError:  # unhashable cells, e.g. lists
+            return False
+        if isinstance(value, pd.DataFrame):
+            header = [(column, str(dtype)) for column, dtype in value.dtypes.items()]
+        else:
+            header = [(value.name, str(value.dtype))]
+        digest.update(f"{type(value).__name__}:{header!r}\0".encode("utf-8"))
+        digest.update(rows.tobytes())
+        return True
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return False
+        digest.update(f"ndarray:{value.dtype.str}:{value.shape}\0".encode("utf-8"))
+        digest.update(np.ascontiguousarray(value).tobytes())
+        return True
+    if isinstance(value, np.generic):
+        return _fingerprint(value.item(), digest)
+    if isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}:{len(value)}\0".encode("utf-8"))
+        return all(_fingerprint(item, digest) for item in value)
+    if isinstance(value, dict):
+        digest.update(f"dict:{len(value)}\0".encode("utf-8"))
+        try:
+            items = sorted(value.items(), key=lambda item: repr(item[0]))
+        except Exception:
+            return False
+        return all(_fingerprint(k, digest) and _fingerprint(v, digest) for k, v in items)
+    return False
+
+
+def memo_key(code: str, dataset_versions: List[str], inputs: Dict[str, Any]) -> Optional[str]:
+    """Key for a code run over dataset versions and earlier step results; None if the inputs cannot be hashed"""
+    digest = hashlib.sha256(code.strip().encode("utf-8"))
+    digest.update(("\0" + ",".join(sorted(dataset_versions)) + "\0").encode("utf-8"))
+    if not _fingerprint(inputs, digest):
+        return None
+    return digest.hexdigest()
+
+
+async def run_code_memoized(code: str, namespace: Dict[str, Any], dataset_versions: List[str]) -> Tuple[Any, bool]:
+    """execute_code with results reused across iterations, steps and retries"""
+    key = memo_key(code, dataset_versions, namespace.get("results", {}))
+    if key is not None:
+        hit, value = step_memo.get(key)
+        if hit:
+            return value, True
+
+    # execute_code blocks until a worker is free, keep it off the event loop
+    result, success = await asyncio.to_thread(execute_code, code, namespace)
+    if success and key is not None:
+        step_memo.put(key, result)
+    return result, success
+
+
+def _observation(result: Any) -> str:
+    text = str(result)
+    if len(text) > OBSERVATION_CHARS:
+        text = text[:OBSERVATION_CHARS] + f"... [{len(text) - OBSERVATION_CHARS} more characters]"
+    return text
+
+
+def _step_prompt(step: PlanStep, schema: str, inputs: Dict[str, Any], history: List[Tuple[str, Any, bool]]) -> str:
+    parts = [f"Question: {step.question}"]
+    if step.datasets:
+        parts.append(f"Relevant datasets: {', '.join(step.datasets)}")
+    parts.append(f"Dataset schemas:\n{schema}")
+    if inputs:
+        parts.append("Results of earlier steps (available in `results`):\n" + "\n".join(
+            f"- {step_id}: {_observation(value)}" for step_id, value in inputs.items()
+        ))
+    for i, (code, result, success) in enumerate(history, start=1):
+        status = "Result" if success else "Error"
+        parts.append(f"Attempt {i}:\n```python\n{code}\n```\n{status}:\n{_observation(result)}")
+    return "\n\n".join(parts)
+
+
+async def _coder_turn(prompt: str) -> Tuple[Optional[str], str]:
+    """
+    Stream one reply of the coding agent. Returns its first ```python block as
+    soon as the closing fence arrives, cancelling the rest of the reply, or
+    None and the full text when the reply has no code.
+    """
+    extractor = IncrementalPythonExtractor()
+    text: List[str] = []
+    streamed = Runner.run_streamed(coding_agent, prompt)
+    deltas = text_deltas(streamed)
+    try:
+        async for delta in deltas:
+            text.append(delta)
+            blocks = extractor.feed(delta)
+            if blocks:
+                return blocks[0], "".join(text)
+        blocks = extractor.finish()
+        return (blocks[0] if blocks else None), "".join(text)
+    finally:
+        await deltas.aclose()
+        streamed.cancel()
+
+
+async def run_step(
+    step: PlanStep,
+    dataframes: Dict[str, Any],
+    dataset_versions: List[str],
+    schema: str,
+    inputs: Dict[str, Any],
+    max_iterations: int = MAX_STEP_ITERATIONS,
+) -> StepResult:
+    """
+    Answer one plan step with a ReAct loop: the coding agent writes code, sees
+    the result (or traceback), and either revises it or gives a final answer
+    """
+    namespace = {"dataframes": dataframes, "results": inputs}
+    history: List[Tuple[str, Any, bool]] = []
+
+    for iteration in range(1, max_iterations + 1):
+        code, text = await _coder_turn(_step_prompt(step, schema, inputs, history))
+
+        if code is None:
+            parsed = extract_json(text)
+            answer = parsed.get("final_answer") if isinstance(parsed, dict) else None
+            last = history[-1] if history else (None, None, False)
+            return StepResult(step.id, str(answer or text), last[1], last[0], bool(history) and last[2], iteration)
+
+        result, success = await run_code_memoized(code, namespace, dataset_versions)
+        history.append((code, result, success))
+
+    code, result, success = history[-1]
+    logger.info(f"Analysis step {step.id} stopped after {max_iterations} iterations")
+    return StepResult(step.id, _observation(result), result, code, success, max_iterations)
@@ -1,8 +1,126 @@
-# build a data analyst agent that delegates tasks to lower agents 
+# build a data analyst agent that delegates tasks to lower agents
 
-from agents import Agent, Runner
+import asyncio
+import logging
+import os
+from typing import Any, AsyncIterable, Dict, List, NamedTuple, Tuple
+
+from agents import Agent, RunContextWrapper, Runner, function_tool
+
+from ..dataset_store import dataset_store
+from ..schema_catalog import format_matches, session_catalog
+from .coding_subagents import StepResult, run_step
+from .planner import DATA_ANALYST_MODEL, PlanStep, stream_plan
+
+
+logger = logging.getLogger(__name__)
+
+# Steps in flight at once; execute_code additionally queues on the code worker pool
+MAX_PARALLEL_STEPS = int(os.getenv("ATLAS_ANALYSIS_MAX_PARALLEL_STEPS", "4"))
 
 DataAnalystAgent = Agent(
     name="data_analyst_agent",
-    model="gpt-4.1"
-)
\ No newline at end of file
+    model=DATA_ANALYST_MODEL,
+    instructions=(
+        "You are a healthcare data analyst. Combine the results of the analysis steps into a "
+        "concise answer to the user's request. Quote the numbers the steps produced and say "
+        "which steps failed, if any."
+    ),
+)
+
+
+class AnalysisResult(NamedTuple):
+    answer: str
+    plan: List[PlanStep]
+    steps: Dict[str, StepResult]
+
+
+def _dataset_versions(session_id: str) -> List[str]:
+    return sorted(dataset_store.session_index(session_id).values())
+
+
+def _catalog(session_id: str) -> str:
+    parts = []
+    for filename, dataset_id in dataset_store.session_index(session_id).items():
+        parts.append(f"File '{filename}':\n{dataset_store.describe(dataset_id)}")
+    return "\n\n".join(parts) or "No datasets uploaded."
+
+
+async def run_plan(
+    plan: AsyncIterable[PlanStep],
+    dataframes: Dict[str, Any],
+    dataset_versions: List[str],
+    schema: str,
+    max_parallel: int = MAX_PARALLEL_STEPS,
+) -> Tuple[List[PlanStep], Dict[str, StepResult]]:
+    """
+    Start plan steps as the planner streams them and run each as soon as its
+    dependencies finish, independent steps concurrently. A step whose
+    dependency failed still runs, with whatever results are available, so one
+    bad step does not sink the whole analysis.
+    """
+    limit = asyncio.Semaphore(max(1, max_parallel))
+    tasks: Dict[str, asyncio.Task] = {}
+    steps: List[PlanStep] = []
+
+    async def run(step: PlanStep) -> StepResult:
+        deps = await asyncio.gather(*(tasks[d] for d in step.depends_on))
+        inputs = {dep.step_id: dep.result for dep in deps if dep.success}
+        async with limit:
+            try:
+                return await run_step(step, dataframes, dataset_versions, schema, inputs)
+            except Exception as e:
+                logger.error(f"Analysis step {step.id} failed: {e}")
+                return StepResult(step.id, f"[Step failed: {e}]", None, None, False, 0)
+
+    try:
+        # The planner only yields dependencies on earlier steps, so their tasks already exist
+        async for step in plan:
+            steps.append(step)
+            tasks[step.id] = asyncio.create_task(run(step))
+        results = await asyncio.gather(*tasks.values())
+    finally:
+        for task in tasks.values():
+            task.cancel()
+    return steps, {result.step_id: result for result in results}
+
+
+async def run_analysis(question: str, session_id: str, max_parallel: int = MAX_PARALLEL_STEPS) -> AnalysisResult:
+    """Plan an analysis over a conversation's datasets, run the steps, and summarize the results"""
+    schema = await asyncio.to_thread(_catalog, session_id)
+    dataset_versions = await asyncio.to_thread(_dataset_versions, session_id)
+    # DatasetRef handles: workers memory-map the data instead of receiving copies
+    dataframes = await asyncio.to_thread(dataset_store.session_refs, session_id)
+
+    # The catalog points the planner at the right columns across many files and sheets
+    catalog = await asyncio.to_thread(session_catalog, session_id)
+    column_hints = format_matches(catalog.match_text(question))
+
+    plan = stream_plan(question, schema, column_hints)
+    plan_steps, steps = await run_plan(plan, dataframes, dataset_versions, schema, max_parallel)
+
+    report = "\n\n".join(
+        f"Step {step.id} ({step.question}):\n{steps[step.id].answer}" for step in plan_steps
+    )
+    summary = await Runner.run(DataAnalystAgent, f"User request:\n{question}\n\nStep results:\n{report}")
+    return AnalysisResult(str(summary.final_output), plan_steps, steps)
+
+
+@function_tool
+async def analyze_datasets(ctx: RunContextWrapper[Any], request: str) -> str:
+    """
+    Analyze the CSV and Excel files uploaded in this conversation: plans the
+    analysis, runs the steps as code over the full data, and summarizes the results.
+
+    Args:
+        request: The user's analysis request, in full.
+    """
+    session_id = getattr(ctx.context, "session_id", None)
+    if not session_id or not dataset_store.session_index(session_id):
+        return "No CSV or Excel files have been uploaded in this conversation."
+    try:
+        result = await run_analysis(request, session_id)
+    except Exception as e:
+        logger.error(f"Dataset analysis failed: {e}")
+        return f"[Error analyzing datasets: {e}]"
+    return result.answer
@@ -0,0 +1,89 @@
+import logging
+import os
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+
+from agents import Agent, Runner
+
+from ..stream_events import text_deltas
+from .utils import stream_json_objects
+
+
+logger = logging.getLogger(__name__)
+
+DATA_ANALYST_MODEL = os.getenv("ATLAS_DATA_ANALYST_MODEL", "gpt-4.1")
+MAX_PLAN_STEPS = int(os.getenv("ATLAS_ANALYSIS_MAX_STEPS", "8"))
+
+PLANNER_INSTRUCTIONS = """You plan data analyses for a team of coding agents.
+Break the user's request into the smallest set of analysis steps. Each step answers one
+question about one file or sheet, or combines the results of earlier steps.
+Steps start running as soon as you write them, and steps that do not depend on each other
+run at the same time, so list the independent steps first and only list a dependency when a
+step really needs another step's result. A step can only depend on steps written before it.
+
+Reply with one JSON object per step, one per line, and nothing else:
+{"id": "s1", "question": "...", "datasets": ["file.csv" or "file.xlsx/Sheet1"], "depends_on": []}"""
+
+planner_agent = Agent(
+    name="data_analyst_planner",
+    model=DATA_ANALYST_MODEL,
+    instructions=PLANNER_INSTRUCTIONS,
+)
+
+
+class PlanStep(NamedTuple):
+    id: str
+    question: str
+    datasets: List[str]
+    depends_on: List[str]
+
+
+def parse_step(raw: Any, seen: Dict[str, PlanStep]) -> Optional[PlanStep]:
+    """
+    Validate one step object from the planner. Dependencies on steps not seen
+    yet (or on itself) are dropped, so steps in arrival order never form a cycle.
+    Returns None for malformed or duplicate steps.
+    """
+    if not isinstance(raw, dict) or not raw.get("question"):
+        return None
+    step_id = str(raw.get("id") or f"s{len(seen) + 1}")
+    if step_id in seen:
+        return None
+    return PlanStep(
+        step_id,
+        str(raw["question"]),
+        [str(d) for d in raw.get("datasets") or []],
+        [str(d) for d in raw.get("depends_on") or [] if str(d) in seen],
+    )
+
+
+async def stream_plan(question: str, catalog: str, column_hints: str = "") -> AsyncIterator[PlanStep]:
+    """
+    Stream the planner's steps, each yielded as soon as its JSON object is
+    complete, so the first steps run while the rest are still being written.
+    A plan with no usable step falls back to one step answering the whole question.
+    """
+    prompt = f"Available datasets:\n{catalog}\n\nUser request:\n{question}"
+    if column_hints:
+        prompt += f"\n\nColumns matching the request:\n{column_hints}"
+
+    steps: Dict[str, PlanStep] = {}
+    streamed = Runner.run_streamed(planner_agent, prompt)
+    objects = stream_json_objects(text_deltas(streamed))
+    try:
+        async for parsed in objects:
+            # Also accept the whole plan as one {"steps": [...]} object
+            candidates = parsed["steps"] if isinstance(parsed.get("steps"), list) else [parsed]
+            for raw in candidates:
+                step = parse_step(raw, steps)
+                if step is None or len(steps) >= MAX_PLAN_STEPS:
+                    continue
+                steps[step.id] = step
+                yield step
+    except Exception as e:
+        logger.error(f"Planner failed: {e}")
+    finally:
+        await objects.aclose()
+        streamed.cancel()
+
+    if not steps:
+        yield PlanStep("s1", question, [], [])
@@ -1,31 +1,36 @@
 import re
 import logging 
 import json 
-import traceback 
-import pandas as pd 
 import copy 
-import numpy as np 
+
+from ..profiling import request_stage
+from .worker_pool import get_code_pool, run_code
+
+logger = logging.getLogger(__name__)
 
 def extract_json(input_str: str):
     """
     Extracts the last complete JSON object found within curly braces {} 
-    from an input string. Uses a greedy regex match for the initial block.
+    from an input string. Uses a greedy match (first '{' to last '}') for the initial block.
     Attempts to fix common issues like trailing commas, single quotes for strings/keys,
     and Python-style booleans/None. It will also attempt to parse only the first
     JSON object if trailing non-JSON data is present after fixes.
     """
-    # Pattern to find a block enclosed in curly braces.
-    # The original function used a greedy match to find the last such block.
-    pattern = r'(\{.*\})' 
-    matches = re.findall(pattern, input_str, re.DOTALL)
-    
-    if not matches:
+    # Same span the greedy r'(\{.*\})' regex matched, found with two linear scans
+    start = input_str.find('{')
+    end = input_str.rfind('}')
+
+    if start == -1 or end < start:
         # Handle cases where no {}-enclosed block was found at all
         return "Pattern '{}' not found in the input string."
 
-    # Use the last match found (as per the original logic)
-    match_content = matches[-1].strip()
+    return repair_json(input_str[start:end + 1].strip())
 
+def repair_json(match_content: str):
+    """
+    Parse a {...} candidate, fixing common LLM-generated issues if plain parsing fails.
+    Returns the parsed object, or an error message string describing both failures.
+    """
     # Step 1: Get rid of trailing commas before a closing brace or bracket.
     clean_match = re.sub(r',\s*([}\]])', r'\1', match_content)
     
@@ -92,59 +97,472 @@ def extract_python(input_str):
 
     return matches[0]
 
+class IncrementalPythonExtractor:
+    """
+    Streaming counterpart of extract_python: feed() text deltas and get back each
+    ```python fenced block as soon as its closing fence arrives, with the same
+    result extract_python gives for it. Only a few characters are kept between
+    deltas outside a block, so the scan stays linear.
+    """
+
+    OPEN = "```python"
+    CLOSE = "\n```"
+
+    def __init__(self):
+        self.blocks = []
+        self._state = "seek"
+        self._window = ""
+        self._parts = []
+        self._tail = ""
+        self._pending = None
+
+    @staticmethod
+    def _trim(code: str) -> str:
+        # extract_python's greedy \s* starts the code after the last newline of its leading whitespace
+        lead = code[:len(code) - len(code.lstrip())]
+        newline = lead.rfind("\n")
+        return code[newline + 1:] if newline != -1 else code
+
+    def feed(self, delta: str) -> list:
+        completed = []
+        text = delta
+
+        while text:
+            if self._state == "seek":
+                buf = self._window + text
+                i = buf.find(self.OPEN)
+                if i == -1:
+                    self._window = buf[-(len(self.OPEN) - 1):]
+                    break
+                self._state = "whitespace"
+                self._window = ""
+                text = buf[i + len(self.OPEN):]
+
+            elif self._state == "whitespace":
+                # The fence must be followed by whitespace containing a newline
+                stripped = text.lstrip()
+                newline = text.find("\n", 0, len(text) - len(stripped))
+                if newline != -1:
+                    self._state = "code"
+                    self._parts = []
+                    self._tail = ""
+                    self._pending = None
+                    text = text[newline + 1:]
+                elif stripped:
+                    self._state = "seek"
+                    text = stripped
+                else:
+                    break
+
+            else:
+                buf = self._tail + text
+                k = buf.find(self.CLOSE)
+                if k == -1:
+                    self._parts.append(text)
+                    self._tail = buf[-(len(self.CLOSE) - 1):]
+                    break
+
+                cut = k - len(self._tail)  # negative when the fence began in an earlier delta
+                code = "".join(self._parts)
+                code = code[:len(code) + cut] if cut < 0 else code + text[:cut]
+                text = text[cut + len(self.CLOSE):]
+                if self._pending is None and not code.strip():
+                    # A fence right after the opening whitespace: extract_python returns the empty
+                    # block only if no other fence follows, otherwise the text up to that fence
+                    self._pending = self._trim(code)
+                    self._parts = ["```"]
+                    self._tail = "```"
+                    continue
+                completed.append(self._trim(code))
+                self._parts = []
+                self._pending = None
+                self._state = "seek"
+
+        self.blocks.extend(completed)
+        return completed
+
+    def finish(self) -> list:
+        """Call when the stream ends: returns an empty block still waiting to see whether another fence follows"""
+        completed = [] if self._pending is None else [self._pending]
+        self._pending = None
+        self._state = "seek"
+        self.blocks.extend(completed)
+        return completed
+
+
+async def stream_json_objects(deltas):
+    """Yield JSON objects from an async iterator of text deltas as soon as each one closes"""
+    extractor = IncrementalJSONExtractor()
+    async for delta in deltas:
+        for obj in extractor.feed(delta):
+            yield obj
+
+
+class IncrementalJSONExtractor:
+    """
+    Pulls complete JSON objects out of model output while it is still streaming.
+
+    feed() scans each text delta once, tracking brace depth and string/escape state
+    (double- or single-quoted), and returns every top-level {...} object that closed
+    within it, repaired the same way as extract_json. Candidates that still fail to
+    parse after repair are kept in `errors`.
+    """
+
+    # Characters that can change state, per state, so the scan jumps between them
+    _STRUCTURE = re.compile(r'[{}"\']')
+    _IN_STRING = {'"': re.compile(r'["\\]'), "'": re.compile(r"['\\]")}
+
+    def __init__(self):
+        self.objects = []
+        self.errors = []
+        self._parts = []
+        self._depth = 0
+        self._quote = None
+        self._escape = False
+
+    def feed(self, delta: str) -> list:
+        completed = []
+        pos = 0
+        start = 0 if self._depth else None
+
+        while pos < len(delta):
+            if self._depth == 0:
+                # Outside any object only an opening brace matters
+                pos = delta.find('{', pos)
+                if pos == -1:
+                    break
+                self._depth = 1
+                start = pos
+                pos += 1
+                continue
+
+            if self._escape:
+                self._escape = False
+                pos += 1
+                continue
+
+            pattern = self._IN_STRING[self._quote] if self._quote else self._STRUCTURE
+            match = pattern.search(delta, pos)
+            if match is None:
+                break
+            ch = match.group()
+            pos = match.end()
+
+            if self._quote:
+                if ch == '\\':
+                    self._escape = True
+                elif ch == self._quote:
+                    self._quote = None
+            elif ch in '"\'':
+                self._quote = ch
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(delta[start:pos])
+                    candidate = ''.join(self._parts)
+                    self._parts = []
+                    start = None
+
+                    parsed = repair_json(candidate)
+                    if isinstance(parsed, str):
+                        self.errors.append(parsed)
+                    else:
+                        completed.append(parsed)
+
+        if self._depth and start is not None:
+            self._parts.append(delta[start:])
+
+        self.objects.extend(completed)
+        return completed
+
+    @property
+    def pending(self) -> str:
+        """Text of the object currently being received, if any"""
+        return ''.join(self._parts)
+
+
+def _json_column(column):
+    return column if isinstance(column, (str, int, float, bool)) or column is None else str(column)
+
+
 def convert_to_features_list(dataframes_dict):    
+    """
+    Column names per file (and per sheet for workbooks), built directly as a
+    JSON-compatible dict. For datasets in the dataset store prefer
+    schema_catalog.session_catalog(), which is indexed once per upload.
+    """
+    import pandas as pd
     features_list = {}
     for filename, item in dataframes_dict.items():
         if isinstance(item, pd.DataFrame):
-            features_list[filename] = list(dataframes_dict[filename].columns)
+            features_list[filename] = [_json_column(c) for c in item.columns]
 
         elif isinstance(item, dict):
             features_list[filename] = {}
-            for pagename in dataframes_dict[filename]:
-                features_list[filename][pagename] = list(dataframes_dict[filename][pagename].columns)
+            for pagename, page in item.items():
+                features_list[filename][pagename] = [_json_column(c) for c in page.columns]
 
         else:
            features_list[filename] = {} 
 
-    features_list_json = extract_json(str(features_list))
-    
-    return features_list_json
+    return features_list
+
+
+def copy_namespace(local_var):
+    """
+    Copy an execution namespace so generated code cannot mutate the caller's data.
+    DataFrames are copied with DataFrame.copy(), which for Arrow-backed frames
+    loaded from the dataset store shares the immutable (memory-mapped) column
+    buffers instead of duplicating them. Everything else is deep-copied.
+    """
+    import pandas as pd
+    if isinstance(local_var, pd.DataFrame):
+        return local_var.copy()
+    if isinstance(local_var, dict):
+        return {key: copy_namespace(value) for key, value in local_var.items()}
+    return copy.deepcopy(local_var)
 
 
 def execute_code(code, local_var): 
-    logger = logging.getLogger('error_logger')
-    logger.setLevel(logging.ERROR)
-    handler = logging.FileHandler('error_log_data_analyst_agent.txt')
-    handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-    logger.addHandler(handler)
+    """
+    Run generated code that defines main() and return (result, success).
+    Runs on the warm worker pool when one is configured, so the code cannot
+    crash or stall the API process; datasets can be passed as DatasetRef
+    handles and are memory-mapped by the worker instead of copied.
+    """
+    pool = get_code_pool()
+    if pool is not None:
+        outcome = pool.run(code, local_var)
+    else:
+        outcome = run_code(code, copy_namespace(local_var))
 
-    try:
-        namespace = copy.deepcopy(local_var)
-        exec(code, namespace)
-        result = namespace['main']()
-        success = True
-        
-    except Exception as e:
-        tb = traceback.extract_tb(e.__traceback__)
-        error_message = "Traceback:\n"
-        for frame in tb:
-            filename, line_number, function_name, text = frame
-            error_message += f"File: {filename}, Line: {line_number}, in {function_name}\n"
-            error_message += f"  {text}\n"
-        error_message += f"Error: {e}"
-
-        # logging error
-        logger.error(error_message)                    
-        result = error_message
-        success = False
-        
-    return result, success
+    if not outcome.success:
+        logger.error(f"Generated code failed: {outcome.result}", extra={"stage": "execute_code", "code": code})
+
+    return outcome.result, outcome.success
     
 
 
 
 
-def standardize_file(df_input, default_year=2025, **kwargs):
+POSSIBLE_TIME_COLUMNS = [
+    'DATE', 'MONTH', 'TIME', 'PERIOD', 'YEARMONTH', 'DATETIME', 'TIMESTAMP',
+    'DATE_TIME', 'DT', 'TRANS_DT', 'EVENT_DATE', 'ACTIVITY_DATE'
+]
+MONTH_MAP = {
+    'JAN': 1, 'JANUARY': 1, 'FEB': 2, 'FEBRUARY': 2, 'MAR': 3, 'MARCH': 3,
+    'APR': 4, 'APRIL': 4, 'MAY': 5, 'JUN': 6, 'JUNE': 6, 'JUL': 7, 'JULY': 7,
+    'AUG': 8, 'AUGUST': 8, 'SEP': 9, 'SEPT': 9, 'SEPTEMBER': 9, 'OCT': 10, 'OCTOBER': 10,
+    'NOV': 11, 'NOVEMBER': 11, 'DEC': 12, 'DECEMBER': 12
+}
+NEW_DATE_COLUMN = 'DATE'
+
+# Values pandas skips when picking the element it infers a datetime format from
+_DATETIME_SKIP_STRINGS = {'', 'now', 'today', 'NaT', 'nat', 'NAT', 'nan', 'NaN', 'NAN'}
+
+
+def _map_unique(series, func):
+    """
+    Apply a vectorized transform to the distinct non-null values of a column and
+    broadcast the results back, so repeated values are only transformed once.
+    Returns an object array with nulls left as they were.
+    """
+    import numpy as np
+    import pandas as pd
+    codes, uniques = pd.factorize(series)
+    values = series.to_numpy(dtype=object, copy=True)
+    present = codes >= 0
+    values[present] = np.asarray(func(pd.Index(uniques)), dtype=object)[codes[present]]
+    return values
+
+
+def _date_strings(index, valid, codes, labels):
+    """Build the 'YYYY-MM-DD' column: labels[codes] where valid, missing elsewhere"""
+    import numpy as np
+    import pandas as pd
+    # Same dtype the column always had (object on pandas 2, str on pandas 3)
+    dtype = pd.Series(index=index[:0], dtype=str).dtype
+    values = np.full(len(index), np.nan, dtype=object)
+    values[valid] = labels[codes]
+    return pd.Series(values, index=index, dtype=dtype)
+
+
+def _normalize_string_values(series):
+    """Strip, uppercase and replace spaces with underscores in the non-null values of a column"""
+    import pandas as pd
+    normalize = lambda s: s.astype(str).str.strip().str.upper().str.replace(' ', '_')
+
+    if series.dtype != object:
+        # String extension dtypes already run these kernels natively and keep nulls
+        return series.str.strip().str.upper().str.replace(' ', '_')
+
+    # factorize treats equal values of different types (1, 1.0, True) as one,
+    # so only pure string columns take the unique-values shortcut
+    if pd.api.types.infer_dtype(series, skipna=True) == 'string':
+        return pd.Series(_map_unique(series, normalize), index=series.index, name=series.name, dtype=object)
+
+    series = series.copy()
+    mask_notna = series.notna()
+    series.loc[mask_notna] = normalize(series.loc[mask_notna])
+    return series
+
+
+def _guess_date_format(series):
+    """Infer a datetime format from the first usable string, the same way pd.to_datetime does"""
+    import numpy as np
+    import pandas as pd
+    for value in series:
+        if value is None or value is pd.NaT or value is pd.NA:
+            continue
+        if isinstance(value, float) and np.isnan(value):
+            continue
+        if type(value) is not str:
+            return None
+        if value in _DATETIME_SKIP_STRINGS:
+            continue
+        return pd.tseries.api.guess_datetime_format(value)
+    return None
+
+
+def _is_month_name_column(series):
+    try:
+        unique_vals = series.dropna().astype(str).str.upper().unique()
+        return any(m in MONTH_MAP for m in unique_vals[:10])
+    except Exception:
+        return False  # Ignore errors during this heuristic check
+
+
+def _plan_standardization(df):
+    """Decide once which column holds dates and how to parse it"""
+    import pandas as pd
+    time_col_name = next((col for col in POSSIBLE_TIME_COLUMNS if col in df.columns), None)
+    plan = {'time_col': time_col_name, 'month_names': False, 'date_format': None}
+
+    if time_col_name:
+        column = df[time_col_name]
+        if time_col_name == 'MONTH' and pd.api.types.is_string_dtype(column.dtype):
+            plan['month_names'] = _is_month_name_column(column)
+        if not plan['month_names'] and pd.api.types.is_string_dtype(column.dtype):
+            plan['date_format'] = _guess_date_format(column)
+
+    return plan
+
+
+def _month_name_dates(df, time_col_name, default_year):
+    """'YYYY-MM-01' strings from a month name column plus a YEAR column (or default_year)"""
+    import numpy as np
+    import pandas as pd
+    month_nums = pd.Series(
+        _map_unique(df[time_col_name], lambda s: s.astype(str).str.upper().map(MONTH_MAP)),
+        index=df.index,
+    )
+    month_nums = pd.to_numeric(month_nums, errors='coerce')
+
+    actual_default_year = default_year if default_year is not None else pd.Timestamp.now().year
+    if 'YEAR' in df.columns:
+        years = pd.to_numeric(df['YEAR'], errors='coerce').fillna(actual_default_year).to_numpy(dtype=float)
+    else:
+        years = np.full(len(df), float(actual_default_year))
+
+    if np.isinf(years).any():
+        raise OverflowError("cannot convert float infinity to integer")
+
+    # Month must be valid and the year a whole number
+    final_valid_idx = month_nums.notna().to_numpy() & (years == np.floor(years))
+
+    # Format each distinct (year, month) pair once
+    year_month = years[final_valid_idx].astype(np.int64) * 100 + month_nums.to_numpy()[final_valid_idx].astype(np.int64)
+    codes, uniques = pd.factorize(year_month)
+    labels = np.array([f"{ym // 100}-{ym % 100:02d}-01" for ym in uniques], dtype=object)
+    return _date_strings(df.index, final_valid_idx, codes, labels)
+
+
+def _parsed_dates(series, date_format):
+    """'YYYY-MM-DD' strings for a column parsed with pd.to_datetime"""
+    import numpy as np
+    import pandas as pd
+    # errors='coerce' turns unparseable dates into NaT
+    datetime_col = pd.to_datetime(series, errors='coerce', format=date_format)
+    valid_idx = datetime_col.notna().to_numpy()
+
+    if not pd.api.types.is_datetime64_any_dtype(datetime_col.dtype):
+        # Mixed time zones come back as objects; fall back to per-value formatting
+        dates = pd.Series(index=series.index, dtype=str)
+        if valid_idx.any():
+            dates.loc[valid_idx] = datetime_col[valid_idx].dt.strftime('%Y-%m-%d')
+        return dates
+
+    if getattr(datetime_col.dt, 'tz', None) is not None:
+        datetime_col = datetime_col.dt.tz_localize(None)  # format local wall time, like strftime
+
+    # Format each distinct day once
+    days = datetime_col.to_numpy()[valid_idx].astype('datetime64[D]')
+    codes, uniques = pd.factorize(days)
+    labels = np.datetime_as_string(np.asarray(uniques, dtype='datetime64[D]'), unit='D').astype(object)
+    return _date_strings(series.index, valid_idx, codes, labels)
+
+
+def _apply_standardization(df, plan, default_year, emit_date=None, categorical_threshold=None):
+    """
+    Run the date and string standardization steps on a DataFrame whose column
+    names are already standardized. emit_date=None keeps the DATE column only if
+    some dates were valid; True/False force the decision (used for chunks).
+    Returns the DataFrame and the processed date column name (or None).
+    """
+    import numpy as np
+    time_col_name = plan['time_col']
+    processed_date_col_name = None
+
+    if time_col_name and time_col_name in df.columns and emit_date is not False:
+        try:
+            if plan['month_names']:
+                dates = _month_name_dates(df, time_col_name, default_year)
+            else:
+                dates = _parsed_dates(df[time_col_name], plan['date_format'])
+
+            if emit_date or not dates.isnull().all():
+                df[NEW_DATE_COLUMN] = dates.replace({np.nan: None})
+                processed_date_col_name = NEW_DATE_COLUMN
+
+                if time_col_name != NEW_DATE_COLUMN and time_col_name in df.columns:
+                    df = df.drop(columns=[time_col_name])
+
+                # Move the new/processed 'DATE' column to the front
+                df.insert(0, NEW_DATE_COLUMN, df.pop(NEW_DATE_COLUMN))
+            elif NEW_DATE_COLUMN in df.columns and df[NEW_DATE_COLUMN].isnull().all():
+                df = df.drop(columns=[NEW_DATE_COLUMN], errors='ignore')
+
+        except Exception:
+            processed_date_col_name = None
+
+    try:
+        string_cols = df.select_dtypes(include=['object', 'string']).columns
+        if processed_date_col_name and processed_date_col_name in string_cols:
+            string_cols = string_cols.drop(processed_date_col_name)
+
+        for col in string_cols:
+            df[col] = _normalize_string_values(df[col])
+            if categorical_threshold is not None and len(df) and df[col].nunique() / len(df) <= categorical_threshold:
+                df[col] = df[col].astype('category')
+    except Exception:
+        pass
+
+    return df, processed_date_col_name
+
+
+def _with_standardized_columns(df_input):
+    # Shallow copy: every step below replaces whole columns, so the caller's data is never written to
+    df = df_input.copy(deep=False)
+    try:
+        df.columns = [str(col).upper().strip().replace(' ', '_') for col in df.columns]
+    except Exception:
+        pass  # Use original names if standardization fails
+    return df
+
+
+def standardize_file(df_input, default_year=2025, categorical_threshold=None, **kwargs):
     """
     Standardizes a DataFrame by:
     1. Uppercasing and replacing spaces with underscores in column names.
@@ -157,11 +575,17 @@ def standardize_file(df_input, default_year=2025, **kwargs):
          and formats valid dates to 'YYYY-MM-DD'.
     4. Standardizing other string column values (uppercase, strip, replace space with underscore).
 
+    String values are normalized once per distinct value and broadcast back, and the
+    input is not deep-copied, so large low-cardinality tables need little extra memory.
+
     Args:
         df_input (pd.DataFrame): The input DataFrame.
         default_year (int, optional): The default year to use if a year column is not found
                                       or contains missing values when processing a 'MONTH' column.
                                       Defaults to 2025.
+        categorical_threshold (float, optional): If set, string columns whose share of distinct
+                                      values is at or below this ratio are returned as
+                                      categorical dtype. Defaults to None (plain strings).
         **kwargs: Additional keyword arguments (currently unused).
 
     Returns:
@@ -171,141 +595,63 @@ def standardize_file(df_input, default_year=2025, **kwargs):
     Raises:
         TypeError: If df_input is not a pandas DataFrame.
     """
-
-    POSSIBLE_TIME_COLUMNS = [
-        'DATE', 'MONTH', 'TIME', 'PERIOD', 'YEARMONTH', 'DATETIME', 'TIMESTAMP',
-        'DATE_TIME', 'DT', 'TRANS_DT', 'EVENT_DATE', 'ACTIVITY_DATE'
-    ]
-    MONTH_MAP = {
-        'JAN': 1, 'JANUARY': 1, 'FEB': 2, 'FEBRUARY': 2, 'MAR': 3, 'MARCH': 3,
-        'APR': 4, 'APRIL': 4, 'MAY': 5, 'JUN': 6, 'JUNE': 6, 'JUL': 7, 'JULY': 7,
-        'AUG': 8, 'AUGUST': 8, 'SEP': 9, 'SEPT': 9, 'SEPTEMBER': 9, 'OCT': 10, 'OCTOBER': 10,
-        'NOV': 11, 'NOVEMBER': 11, 'DEC': 12, 'DECEMBER': 12
-    }
-
+    import pandas as pd
     if not isinstance(df_input, pd.DataFrame):
         raise TypeError("Input must be a pandas DataFrame.")
 
     if df_input.empty:
         return pd.DataFrame() # Return empty DataFrame if input is empty
 
-    df = df_input.copy() # Work on a copy
-
-    # --- 1. Standardize Column Names ---
-    try:
-        df.columns = [str(col).upper().strip().replace(' ', '_') for col in df.columns]
-        standardized_cols = df.columns
-    except Exception as e:
-        # print(f"Warning: Could not standardize column names: {e}") # Optional logging
-        standardized_cols = df.columns # Use original names if standardization fails
-
-    # --- 2. Identify and Process Potential Date Column ---
-    time_col_name = next((col for col in POSSIBLE_TIME_COLUMNS if col in standardized_cols), None)
-    processed_date_col_name = None # Track if date processing was successful
-    new_date_col = 'DATE'          # Target name for the processed date column
-
-    if time_col_name:
-        try:
-            original_dtype = df[time_col_name].dtype
-            temp_standardized_dates_str = pd.Series(index=df.index, dtype=str) # Store 'YYYY-MM-DD' strings
-
-            is_likely_month_col = False
-            if time_col_name == 'MONTH' and pd.api.types.is_string_dtype(original_dtype):
-                try:
-                    unique_vals = df[time_col_name].dropna().astype(str).str.upper().unique()
-                    if any(m in MONTH_MAP for m in unique_vals[:10]):
-                        is_likely_month_col = True
-                except Exception:
-                    pass # Ignore errors during this heuristic check
-
-            if is_likely_month_col:
-                # --- Handle Month Name Column Case (e.g., 'MONTH' column with 'JAN', 'FEB') ---
-                month_nums = df[time_col_name].astype(str).str.upper().map(MONTH_MAP)
-                base_valid_idx = month_nums.notna() # Rows where month name was successfully mapped
-
-                # Determine the year to use for each row
-                year_values_for_construction = pd.Series(index=df.index, dtype='object')
-                actual_default_year = default_year if default_year is not None else pd.Timestamp.now().year
-
-                if 'YEAR' in standardized_cols:
-                    year_series_numeric = pd.to_numeric(df['YEAR'], errors='coerce')
-                    year_values_for_construction = year_series_numeric.fillna(actual_default_year)
-                else:
-                    year_values_for_construction.fillna(actual_default_year, inplace=True)
-
-                # Ensure both month and year are valid for construction
-                # and year is a whole number (int)
-                final_valid_idx = base_valid_idx & \
-                                  year_values_for_construction.notna() & \
-                                  (year_values_for_construction.apply(lambda x: isinstance(x, (int, float)) and x == int(x)))
-
-
-                if final_valid_idx.any():
-                    years_str = year_values_for_construction[final_valid_idx].astype(int).astype(str)
-                    months_str = month_nums[final_valid_idx].astype(int).astype(str).str.zfill(2)
-                    day_str = "01" # Default to the 1st day of the month
-
-                    temp_standardized_dates_str.loc[final_valid_idx] = years_str + '-' + months_str + '-' + day_str
-            
-            else:
-                # --- Handle Other Potential Date/Time Column Cases ---
-                # Attempt standard datetime conversion
-                # Pandas to_datetime can infer many formats. errors='coerce' turns unparseable dates into NaT.
-                datetime_col = pd.to_datetime(df[time_col_name], errors='coerce')
-                valid_idx = datetime_col.notna() # Find where conversion succeeded
-                
-                if valid_idx.any():
-                    # Format valid datetime objects to 'YYYY-MM-DD' string
-                    temp_standardized_dates_str.loc[valid_idx] = datetime_col[valid_idx].dt.strftime('%Y-%m-%d')
-
-            # --- Assign results to DataFrame and clean up ---
-            if not temp_standardized_dates_str.isnull().all():
-                df[new_date_col] = temp_standardized_dates_str.replace({np.nan: None})
-                processed_date_col_name = new_date_col
-
-                if time_col_name != new_date_col and time_col_name in df.columns:
-                    df = df.drop(columns=[time_col_name])
-                
-                # Move the new/processed 'DATE' column to the front
-                cols = [processed_date_col_name] + [col for col in df.columns if col != processed_date_col_name]
-                df = df[cols]
-            else:
-                if new_date_col in df.columns and df[new_date_col].isnull().all():
-                    df = df.drop(columns=[new_date_col], errors='ignore')
-
-        except Exception as e:
-            # print(f"Warning: Could not process time column '{time_col_name}': {e}") # Optional logging
-            processed_date_col_name = None # Ensure it's marked as failed
-
-    # --- 3. Standardize String Column Values ---
-    try:
-        string_cols = df.select_dtypes(include=['object', 'string']).columns
+    with request_stage("standardize_file"):
+        df = _with_standardized_columns(df_input)
+        plan = _plan_standardization(df)
+        df, _ = _apply_standardization(df, plan, default_year, categorical_threshold=categorical_threshold)
+    return df
 
-        if processed_date_col_name and processed_date_col_name in string_cols:
-            # Check dtype just in case it was converted to something else unexpectedly
-            # The 'DATE' column should now contain strings like 'YYYY-MM-DD' or None
-            if pd.api.types.is_object_dtype(df[processed_date_col_name].dtype) or \
-               pd.api.types.is_string_dtype(df[processed_date_col_name].dtype):
-                string_cols = string_cols.drop(processed_date_col_name)
 
-        for col in string_cols:
-            if col in df.columns: # Check column still exists
-                # Ensure we only apply string methods to actual string data, handling NaNs
-                # Convert to string, then apply operations. NaNs become 'nan' string.
-                # Strip whitespace, uppercase, replace space with underscore.
-                # df.loc[:, col] = df[col].astype(str).str.strip().str.upper().str.replace(' ', '_')
-                
-                # More robust handling for mixed types / NaNs before string conversion
-                mask_notna = df[col].notna()
-                df.loc[mask_notna, col] = df.loc[mask_notna, col].astype(str).str.strip().str.upper().str.replace(' ', '_')
-
-
-    except Exception as e:
-        # print(f"Warning: Could not standardize string column values: {e}") # Optional logging
-        pass
+def standardize_file_chunks(chunks, default_year=2025, categorical_threshold=None, **kwargs):
+    """
+    Streaming version of standardize_file for tables larger than memory.
 
-    # --- 4. Return Standardized DataFrame ---
-    return df
+    Takes an iterable of DataFrame chunks (e.g. pd.read_csv(..., chunksize=N)) and
+    yields standardized chunks. The date column, month-name handling and datetime
+    format are decided on the first non-empty chunk and reused for the rest, so every
+    chunk has the same columns. Output matches standardize_file on the full table
+    whenever the first chunk is representative of those decisions.
+    """
+    plan = None
+    emit_date = None
+    dropped_date = False
+
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+
+        df = _with_standardized_columns(chunk)
+        if plan is None:
+            plan = _plan_standardization(df)
+            had_date = NEW_DATE_COLUMN in df.columns
+            df, processed = _apply_standardization(df, plan, default_year, categorical_threshold=categorical_threshold)
+            emit_date = processed is not None
+            dropped_date = had_date and NEW_DATE_COLUMN not in df.columns
+        else:
+            if dropped_date:
+                df = df.drop(columns=[NEW_DATE_COLUMN], errors='ignore')
+            df, _ = _apply_standardization(
+                df, plan, default_year, emit_date=emit_date, categorical_threshold=categorical_threshold
+            )
+        yield df
+
+
+def standardize_csv_file(input_path, output_path, chunksize=500_000, default_year=2025, **read_csv_kwargs):
+    """Standardize a CSV file chunk by chunk into output_path without loading it all into memory"""
+    import pandas as pd
+    chunks = pd.read_csv(input_path, chunksize=chunksize, **read_csv_kwargs)
+    rows = 0
+    for i, df in enumerate(standardize_file_chunks(chunks, default_year=default_year)):
+        df.to_csv(output_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        rows += len(df)
+    return rows
 
 
 def convert_features_list_to_array(features_list):
@@ -0,0 +1,233 @@
+import contextlib
+import io
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import time
+import traceback
+from typing import Any, Dict, NamedTuple, Optional
+
+
+logger = logging.getLogger(__name__)
+
+CODE_WORKERS = int(os.getenv("ATLAS_CODE_WORKERS", "2"))
+CODE_TIMEOUT_SECONDS = float(os.getenv("ATLAS_CODE_TIMEOUT_SECONDS", "120"))
+CODE_MEMORY_LIMIT_BYTES = int(os.getenv("ATLAS_CODE_MEMORY_LIMIT_BYTES", str(4 * 1024 ** 3)))
+CODE_WORKER_MAX_TASKS = int(os.getenv("ATLAS_CODE_WORKER_MAX_TASKS", "200"))
+
+
+class ExecutionResult(NamedTuple):
+    result: Any
+    success: bool
+    stdout: str
+    duration: float
+
+
+def format_exception(e: BaseException) -> str:
+    """Format an exception raised by generated code the way the data analyst prompts expect"""
+    tb = traceback.extract_tb(e.__traceback__)
+    error_message = "Traceback:\n"
+    for frame in tb:
+        filename, line_number, function_name, text = frame
+        error_message += f"File: {filename}, Line: {line_number}, in {function_name}\n"
+        error_message += f"  {text}\n"
+    error_message += f"Error: {e}"
+    return error_message
+
+
+def _resolve_refs(value, tables: Dict[Any, Any]):
+    """Replace DatasetRef placeholders with Arrow-backed DataFrames over memory-mapped files"""
+    from ..dataset_store import DatasetRef, dataset_store
+
+    if isinstance(value, DatasetRef):
+        import pandas as pd
+
+        if value not in tables:
+            tables[value] = dataset_store.open_table(value.dataset_id, value.sheet)
+        # A fresh DataFrame wrapper per run: buffers are shared and immutable,
+        # so writes made by generated code never leak into the next run.
+        return tables[value].to_pandas(types_mapper=pd.ArrowDtype)
+    if isinstance(value, dict):
+        return {key: _resolve_refs(item, tables) for key, item in value.items()}
+    return value
+
+
+def run_code(code: str, local_var: Dict[str, Any], tables: Optional[Dict[Any, Any]] = None) -> ExecutionResult:
+    """Execute generated code defining main() and capture its result, stdout and traceback"""
+    stdout = io.StringIO()
+    start = time.perf_counter()
+    try:
+        namespace = _resolve_refs(local_var, {} if tables is None else tables)
+        with contextlib.redirect_stdout(stdout):
+            exec(code, namespace)
+            result = namespace['main']()
+        success = True
+    except (Exception, SystemExit) as e:
+        result = format_exception(e)
+        success = False
+    return ExecutionResult(result, success, stdout.getvalue(), time.perf_counter() - start)
+
+
+def _worker_main(conn, memory_limit: int) -> None:
+    if memory_limit > 0:
+        try:
+            import resource
+
+            # RLIMIT_DATA caps private heap allocations but not file-backed
+            # mappings, so memory-mapped datasets don't count against it
+            resource.setrlimit(resource.RLIMIT_DATA, (memory_limit, memory_limit))
+        except (ImportError, ValueError, OSError):
+            pass
+
+    # Warm the libraries generated code relies on before taking work
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    import scipy  # noqa: F401
+    import sklearn  # noqa: F401
+
+    tables: Dict[Any, Any] = {}
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        code, local_var = message
+        outcome = run_code(code, local_var, tables)
+        try:
+            conn.send(outcome)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            conn.send(outcome._replace(result=repr(outcome.result)))
+
+
+class _Worker:
+    def __init__(self, ctx, memory_limit: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, memory_limit), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.conn.close()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class CodeWorkerPool:
+    """
+    Pool of pre-started worker processes for generated data analysis code.
+
+    Each worker imports pandas/numpy/scipy/scikit-learn once at startup and then
+    serves runs over a pipe. Runs are isolated from the API process: a timeout
+    or crash kills only that worker, which is replaced immediately. Datasets
+    passed as DatasetRef are memory-mapped by the worker rather than copied.
+    """
+
+    def __init__(
+        self,
+        size: int = CODE_WORKERS,
+        timeout: float = CODE_TIMEOUT_SECONDS,
+        memory_limit: int = CODE_MEMORY_LIMIT_BYTES,
+        max_tasks: int = CODE_WORKER_MAX_TASKS,
+    ):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_tasks = max_tasks
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._ctx, self.memory_limit)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _replace(self, worker: _Worker, kill: bool) -> _Worker:
+        worker.kill() if kill else worker.stop()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        return self._spawn()
+
+    def run(self, code: str, local_var: Dict[str, Any], timeout: Optional[float] = None) -> ExecutionResult:
+        timeout = self.timeout if timeout is None else timeout
+        worker = self._idle.get()
+        start = time.perf_counter()
+        try:
+            try:
+                worker.conn.send((code, local_var))
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                return ExecutionResult(f"Error: namespace could not be sent to worker: {e}", False, "", 0.0)
+
+            if not worker.conn.poll(timeout):
+                worker = self._replace(worker, kill=True)
+                return ExecutionResult(f"Error: execution timed out after {timeout:g}s", False, "", time.perf_counter() - start)
+
+            outcome = worker.conn.recv()
+            worker.tasks += 1
+            if worker.tasks >= self.max_tasks:
+                worker = self._replace(worker, kill=False)
+            return outcome
+
+        except (EOFError, OSError) as e:
+            worker.process.join(timeout=1)
+            exitcode = worker.process.exitcode
+            worker = self._replace(worker, kill=True)
+            return ExecutionResult(
+                f"Error: worker process exited unexpectedly (exit code {exitcode}); "
+                f"it may have exceeded the memory limit: {e}",
+                False,
+                "",
+                time.perf_counter() - start,
+            )
+        finally:
+            self._idle.put(worker)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+
+
+_pool: Optional[CodeWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_code_pool() -> Optional[CodeWorkerPool]:
+    """Return the shared code worker pool, or None when ATLAS_CODE_WORKERS is 0"""
+    global _pool
+    if CODE_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = CodeWorkerPool()
+        return _pool
+
+
+def shutdown_code_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -0,0 +1,400 @@
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+from .spreadsheet_reader import CSV, SheetInfo, SpreadsheetReader, detect_format
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATASET_DIR = os.path.join(tempfile.gettempdir(), "atlas_datasets")
+SUMMARY_SAMPLE_ROWS = 5
+SUMMARY_TOP_VALUES = 5
+CATALOG_SAMPLE_ROWS = 10_000
+CATALOG_MAX_VALUES = 50
+# Sheets with more data rows than this are not converted at upload; they are
+# summarized from a preview and materialized the first time code reads them
+EAGER_SHEET_ROWS = int(os.getenv("ATLAS_SPREADSHEET_EAGER_ROWS", "50000"))
+
+_SAFE_ID = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class DatasetRef(NamedTuple):
+    """Picklable handle to one sheet of a stored dataset, resolved by memory-mapping on the reader's side"""
+    dataset_id: str
+    sheet: Optional[str] = None
+
+
+def _safe_id(value: str) -> str:
+    return _SAFE_ID.sub("_", value)[:128]
+
+
+def _write_json_atomic(path: str, payload: Any) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+def _write_table(path: str, table) -> None:
+    """Write an uncompressed Arrow IPC file atomically, ready to be memory-mapped"""
+    import pyarrow as pa
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _drop_partial_line(path: str) -> None:
+    """Cut a truncated text file after its last complete line"""
+    with open(path, "r+b") as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - 64 * 1024)
+            f.seek(start)
+            block = f.read(end - start)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                f.truncate(start + newline + 1)
+                return
+            end = start
+
+
+def is_csv(manifest: Dict[str, Any]) -> bool:
+    """Whether a dataset is a single CSV table rather than a workbook of named sheets"""
+    if "format" in manifest:
+        return manifest["format"] == CSV
+    return manifest["media_type"] == "text/csv"
+
+
+def summarize_table(table, total_rows: Any = None) -> str:
+    """
+    Compact schema and statistics summary of an Arrow table, computed with Arrow
+    kernels. When the table is a preview of a larger sheet, pass the sheet's row
+    count (or a label such as "more than 50000") as total_rows; the statistics
+    are then labelled as covering the preview only.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if total_rows is None or total_rows == table.num_rows:
+        lines = [f"{table.num_rows} rows x {table.num_columns} columns", "Columns:"]
+    else:
+        lines = [
+            f"{total_rows} rows x {table.num_columns} columns",
+            f"Columns (statistics from the first {table.num_rows} rows):",
+        ]
+
+    for name, col in zip(table.column_names, table.columns):
+        dtype = col.type
+        stats = [f"nulls={col.null_count}"]
+        non_null = table.num_rows - col.null_count
+
+        if non_null and (pa.types.is_integer(dtype) or pa.types.is_floating(dtype) or pa.types.is_decimal(dtype)):
+            min_max = pc.min_max(col)
+            stats.append(f"min={min_max['min'].as_py()}")
+            stats.append(f"max={min_max['max'].as_py()}")
+            stats.append(f"mean={pc.mean(col).as_py():.4g}")
+        elif non_null and pa.types.is_temporal(dtype):
+            min_max = pc.min_max(col)
+            stats.append(f"min={min_max['min'].as_py()}")
+            stats.append(f"max={min_max['max'].as_py()}")
+        elif non_null and (pa.types.is_string(dtype) or pa.types.is_large_string(dtype) or pa.types.is_boolean(dtype)):
+            stats.append(f"distinct={pc.count_distinct(col).as_py()}")
+            counts = pc.value_counts(col).flatten()
+            order = pc.sort_indices(counts[1], sort_keys=[("", "descending")])[:SUMMARY_TOP_VALUES]
+            top = [
+                f"{value}({count})"
+                for value, count in zip(pc.take(counts[0], order).to_pylist(), pc.take(counts[1], order).to_pylist())
+                if value is not None
+            ]
+            stats.append("top=" + ", ".join(top))
+
+        lines.append(f"- {name} ({dtype}): " + " ".join(stats))
+
+    if table.num_rows:
+        lines.append(f"First {min(SUMMARY_SAMPLE_ROWS, table.num_rows)} rows:")
+        lines.append(table.slice(0, SUMMARY_SAMPLE_ROWS).to_pandas(types_mapper=pd.ArrowDtype).to_string(index=False))
+
+    return "\n".join(lines)
+
+
+def catalog_columns(table) -> List[Dict[str, Any]]:
+    """
+    Column entries for the schema catalog: name, type and, for low-cardinality
+    string columns, the distinct values seen in the first CATALOG_SAMPLE_ROWS rows
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    sample = table.slice(0, CATALOG_SAMPLE_ROWS)
+    columns = []
+    for name, col in zip(sample.column_names, sample.columns):
+        entry = {"name": name, "type": str(col.type)}
+        if pa.types.is_string(col.type) or pa.types.is_large_string(col.type):
+            unique = pc.unique(col.drop_null())
+            if len(unique) <= CATALOG_MAX_VALUES:
+                entry["values"] = unique.to_pylist()
+        columns.append(entry)
+    return columns
+
+
+class DatasetStore:
+    """
+    On-disk store for uploaded tables.
+
+    Each upload is parsed once into uncompressed Arrow IPC files (one per sheet)
+    under a content-addressed dataset directory, together with a manifest that
+    holds the schema/statistics summary. Conversations reference datasets by id
+    through a small per-session index, and reads memory-map the Arrow files so
+    tables are shared zero-copy between the prompt builder and the data analyst.
+    """
+
+    def __init__(self, root: str = DEFAULT_DATASET_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._materialize_locks: Dict[str, threading.Lock] = {}
+        os.makedirs(os.path.join(self.root, "datasets"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "sessions"), exist_ok=True)
+
+    def _dataset_dir(self, dataset_id: str) -> str:
+        return os.path.join(self.root, "datasets", _safe_id(dataset_id))
+
+    def _session_path(self, session_id: str) -> str:
+        return os.path.join(self.root, "sessions", f"{_safe_id(session_id)}.json")
+
+    # --- datasets ---
+
+    def exists(self, dataset_id: str) -> bool:
+        return os.path.exists(os.path.join(self._dataset_dir(dataset_id), "manifest.json"))
+
+    def ingest(
+        self,
+        dataset_id: str,
+        filename: str,
+        data: Union[bytes, str],
+        media_type: str,
+        truncated: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Persist an upload (bytes, or the path of a downloaded file) as Arrow
+        files; a no-op if the dataset already exists. A truncated upload (only
+        the first bytes of a file too large to download) must be CSV; its
+        partial last line is dropped and the summary says the data is partial.
+
+        The format is detected from the file's magic bytes, not the declared media
+        type. Workbook sheets are streamed one at a time; sheets larger than
+        EAGER_SHEET_ROWS are only summarized from a preview here and converted
+        when first opened, from the original file kept next to the manifest.
+        """
+        if self.exists(dataset_id):
+            return self.manifest(dataset_id)
+
+        final_dir = self._dataset_dir(dataset_id)
+        staging_dir = tempfile.mkdtemp(dir=os.path.join(self.root, "datasets"), prefix=".staging-")
+        try:
+            if isinstance(data, str):
+                shutil.copyfile(data, os.path.join(staging_dir, "source"))
+            else:
+                with open(os.path.join(staging_dir, "source"), "wb") as f:
+                    f.write(data)
+            with open(os.path.join(staging_dir, "source"), "rb") as f:
+                head = f.read(2048)
+            fmt = detect_format(head, os.path.join(staging_dir, "source"))
+            if truncated:
+                if fmt != CSV:
+                    raise ValueError("file is too large to load; only CSV files can be read in part")
+                _drop_partial_line(os.path.join(staging_dir, "source"))
+            source_file = f"source.{fmt}"
+            os.rename(os.path.join(staging_dir, "source"), os.path.join(staging_dir, source_file))
+
+            with SpreadsheetReader(os.path.join(staging_dir, source_file), fmt) as reader:
+                sheets = [
+                    self._ingest_sheet(staging_dir, f"sheet_{i}.arrow", reader, info)
+                    for i, info in enumerate(reader.sheets())
+                ]
+            if all(sheet["materialized"] for sheet in sheets):
+                os.remove(os.path.join(staging_dir, source_file))
+                source_file = None
+
+            manifest = {
+                "filename": filename,
+                "media_type": media_type,
+                "format": fmt,
+                "source": source_file,
+                "truncated": truncated,
+                "sheets": sheets,
+            }
+            _write_json_atomic(os.path.join(staging_dir, "manifest.json"), manifest)
+            try:
+                os.rename(staging_dir, final_dir)
+            except OSError:
+                # Another request ingested the same content first
+                shutil.rmtree(staging_dir, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        return self.manifest(dataset_id)
+
+    def _ingest_sheet(self, directory: str, sheet_file: str, reader: SpreadsheetReader, info: SheetInfo) -> Dict[str, Any]:
+        entry = {"name": info.name, "file": sheet_file}
+        if reader.format != CSV and info.rows is not None and info.rows > EAGER_SHEET_ROWS:
+            preview = reader.read_table(info.name, stop=CATALOG_SAMPLE_ROWS)
+            total_rows = info.rows
+        else:
+            # Small, or a workbook without dimension metadata: read up to the limit to find out
+            table = reader.read_table(info.name, stop=None if reader.format == CSV else EAGER_SHEET_ROWS + 1)
+            if reader.format == CSV or table.num_rows <= EAGER_SHEET_ROWS:
+                _write_table(os.path.join(directory, sheet_file), table)
+                return {
+                    **entry,
+                    "rows": table.num_rows,
+                    "columns": table.column_names,
+                    "summary": summarize_table(table),
+                    "catalog": catalog_columns(table),
+                    "materialized": True,
+                }
+            preview = table.slice(0, CATALOG_SAMPLE_ROWS)
+            total_rows = f"more than {EAGER_SHEET_ROWS}"
+
+        return {
+            **entry,
+            "rows": info.rows,
+            "columns": preview.column_names,
+            "summary": summarize_table(preview, total_rows),
+            "catalog": catalog_columns(preview),
+            "materialized": False,
+        }
+
+    def manifest(self, dataset_id: str) -> Dict[str, Any]:
+        with open(os.path.join(self._dataset_dir(dataset_id), "manifest.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def describe(self, dataset_id: str) -> str:
+        """Prompt-ready schema and statistics summary for every sheet of a dataset"""
+        manifest = self.manifest(dataset_id)
+        sheets = manifest["sheets"]
+        if len(sheets) == 1:
+            summary = sheets[0]["summary"]
+        else:
+            summary = "\n\n".join(f"Sheet '{sheet['name']}': {sheet['summary']}" for sheet in sheets)
+        if manifest.get("truncated"):
+            summary = "Partial file: only the leading rows were loaded, the file exceeds the download limit.\n" + summary
+        return summary
+
+    def catalog(self, dataset_id: str) -> List[Dict[str, Any]]:
+        """Per-sheet catalog column entries; computed from the data for datasets ingested before catalogs existed"""
+        return [
+            {"sheet": sheet["name"], "columns": sheet.get("catalog") or catalog_columns(self.open_table(dataset_id, sheet["name"]))}
+            for sheet in self.manifest(dataset_id)["sheets"]
+        ]
+
+    def open_table(self, dataset_id: str, sheet: Optional[str] = None):
+        """Memory-map one sheet of a dataset as an Arrow table (first sheet by default)"""
+        import pyarrow as pa
+
+        manifest = self.manifest(dataset_id)
+        entry = next((s for s in manifest["sheets"] if sheet is None or s["name"] == sheet), None)
+        if entry is None:
+            raise KeyError(f"Sheet '{sheet}' not found in dataset {dataset_id}")
+
+        path = os.path.join(self._dataset_dir(dataset_id), entry["file"])
+        if not os.path.exists(path):
+            self._materialize(dataset_id, entry["name"])
+        source = pa.memory_map(path, "r")
+        return pa.ipc.open_file(source).read_all()
+
+    def _materialize(self, dataset_id: str, sheet: str) -> None:
+        """Convert a lazily ingested sheet from the original upload and record its full summary"""
+        directory = self._dataset_dir(dataset_id)
+        with self._lock:
+            lock = self._materialize_locks.setdefault(dataset_id, threading.Lock())
+        with lock:
+            manifest = self.manifest(dataset_id)
+            entry = next(s for s in manifest["sheets"] if s["name"] == sheet)
+            path = os.path.join(directory, entry["file"])
+            if os.path.exists(path):
+                return
+
+            with SpreadsheetReader(os.path.join(directory, manifest["source"]), manifest["format"]) as reader:
+                table = reader.read_table(sheet)
+            # Atomic, so a worker process materializing the same sheet never sees a partial file
+            _write_table(path, table)
+            logger.info(f"Materialized sheet '{sheet}' of dataset {dataset_id}: {table.num_rows} rows")
+
+            entry.update({
+                "rows": table.num_rows,
+                "columns": table.column_names,
+                "summary": summarize_table(table),
+                "materialized": True,
+            })
+            _write_json_atomic(os.path.join(directory, "manifest.json"), manifest)
+
+    def open_dataframe(self, dataset_id: str, sheet: Optional[str] = None):
+        """Arrow-backed DataFrame over the memory-mapped table, without copying column buffers"""
+        import pandas as pd
+
+        return self.open_table(dataset_id, sheet).to_pandas(types_mapper=pd.ArrowDtype)
+
+    # --- sessions ---
+
+    def attach(self, session_id: str, filename: str, dataset_id: str) -> None:
+        """Record that a conversation has a dataset under the given filename"""
+        path = self._session_path(session_id)
+        with self._lock:
+            index = self.session_index(session_id)
+            if index.get(filename) == dataset_id:
+                return
+            index[filename] = dataset_id
+            _write_json_atomic(path, index)
+
+    def session_index(self, session_id: str) -> Dict[str, str]:
+        try:
+            with open(self._session_path(session_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def session_refs(self, session_id: str) -> Dict[str, Any]:
+        """
+        Same shape as load_session_dataframes, but with DatasetRef handles instead
+        of DataFrames, for handing datasets to code worker processes without copying
+        """
+        refs: Dict[str, Any] = {}
+        for filename, dataset_id in self.session_index(session_id).items():
+            manifest = self.manifest(dataset_id)
+            if is_csv(manifest):
+                refs[filename] = DatasetRef(dataset_id)
+            else:
+                refs[filename] = {sheet["name"]: DatasetRef(dataset_id, sheet["name"]) for sheet in manifest["sheets"]}
+        return refs
+
+    def load_session_dataframes(self, session_id: str) -> Dict[str, Any]:
+        """
+        Load every dataset of a conversation in the shape the data analyst tools expect:
+        CSV files map to a DataFrame, workbooks map to {sheet_name: DataFrame}.
+        """
+        dataframes: Dict[str, Any] = {}
+        for filename, dataset_id in self.session_index(session_id).items():
+            manifest = self.manifest(dataset_id)
+            if is_csv(manifest):
+                dataframes[filename] = self.open_dataframe(dataset_id)
+            else:
+                dataframes[filename] = {
+                    sheet["name"]: self.open_dataframe(dataset_id, sheet["name"])
+                    for sheet in manifest["sheets"]
+                }
+        return dataframes
+
+
+dataset_store = DatasetStore(os.getenv("ATLAS_DATASET_DIR", DEFAULT_DATASET_DIR))
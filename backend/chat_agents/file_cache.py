@@ -0,0 +1,214 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "atlas_file_cache")
+# Pruning frees space down to this fraction of the disk budget, so it does not rerun on every write
+DISK_PRUNE_TARGET = 0.9
+
+
+def make_cache_key(kind: str, url: str, validator: str) -> str:
+    """Build a content-addressed key from the extractor kind, file URL and ETag/content hash"""
+    raw = f"{kind}\0{url}\0{validator}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def content_hash(data: bytes) -> str:
+    """Hash raw file bytes for use as a cache validator"""
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+class FileContentCache:
+    """
+    Two-tier cache for extracted file text.
+
+    The memory tier is an LRU bounded by the total UTF-8 size of its values.
+    The disk tier stores one file per key so extracted text survives restarts,
+    and is pruned oldest-first once it grows past its byte budget. Its size is
+    tracked in memory (from one scan on first write), so writes only walk the
+    directory when they push it over budget; that walk also resyncs the total
+    with files written or removed by other processes.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+        memory_max_bytes: int = DEFAULT_MEMORY_MAX_BYTES,
+        disk_max_bytes: int = DEFAULT_DISK_MAX_BYTES,
+    ):
+        self.cache_dir = cache_dir
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._memory_bytes = 0
+        self._disk_bytes: Optional[int] = None  # unknown until the first write scans the directory
+        self._lock = threading.Lock()
+
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"File cache disk tier disabled ({self.cache_dir}): {e}")
+                self.cache_dir = None
+
+    # --- memory tier ---
+
+    def _memory_put(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.memory_max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._memory_bytes -= self._sizes.pop(key)
+                del self._entries[key]
+
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._memory_bytes += size
+
+            while self._memory_bytes > self.memory_max_bytes and self._entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._memory_bytes -= self._sizes.pop(old_key)
+                self._stats["memory_evictions"] += 1
+
+    # --- disk tier ---
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.txt")
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = f.read()
+            os.utime(path)  # refresh mtime so pruning stays least-recently-used
+            return value
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"File cache disk read failed for {key}: {e}")
+            return None
+
+    def _disk_put(self, key: str, value: str) -> None:
+        if not self.cache_dir:
+            return
+        if self._disk_bytes is None:
+            self._prune_disk()
+
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(value)
+            size = os.stat(tmp_path).st_size
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)  # atomic, so readers never see partial files
+        except OSError as e:
+            logger.warning(f"File cache disk write failed for {key}: {e}")
+            return
+
+        with self._lock:
+            self._disk_bytes += size - replaced
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """Recount the disk tier and, when over budget, remove least recently used files"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        if total > self.disk_max_bytes:
+            target = self.disk_max_bytes * DISK_PRUNE_TARGET
+            entries.sort()
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    with self._lock:
+                        self._stats["disk_evictions"] += 1
+                except OSError:
+                    pass
+
+        with self._lock:
+            self._disk_bytes = total
+
+    # --- public API ---
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return value
+
+        value = self._disk_get(key)
+        if value is not None:
+            self._memory_put(key, value)
+            with self._lock:
+                self._stats["disk_hits"] += 1
+            return value
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value: str) -> None:
+        self._memory_put(key, value)
+        self._disk_put(key, value)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                **self._stats,
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes or 0,
+            }
+
+
+file_cache = FileContentCache(
+    cache_dir=os.getenv("ATLAS_FILE_CACHE_DIR", DEFAULT_CACHE_DIR) or None,
+    memory_max_bytes=int(os.getenv("ATLAS_FILE_CACHE_MEMORY_BYTES", DEFAULT_MEMORY_MAX_BYTES)),
+    disk_max_bytes=int(os.getenv("ATLAS_FILE_CACHE_DISK_BYTES", DEFAULT_DISK_MAX_BYTES)),
+)
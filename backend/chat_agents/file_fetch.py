@@ -0,0 +1,203 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+from typing import Optional, Tuple, Union
+
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("ATLAS_HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("ATLAS_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("ATLAS_HTTP_TIMEOUT_SECONDS", "30"))
+
+# Downloads stay in memory up to this size and spill to a temp file beyond it
+DOWNLOAD_SPOOL_BYTES = int(os.getenv("ATLAS_DOWNLOAD_SPOOL_BYTES", str(8 * 1024 * 1024)))
+DOWNLOAD_MAX_FILE_BYTES = int(os.getenv("ATLAS_DOWNLOAD_MAX_FILE_BYTES", str(256 * 1024 * 1024)))
+DOWNLOAD_MAX_REQUEST_BYTES = int(os.getenv("ATLAS_DOWNLOAD_MAX_REQUEST_BYTES", str(512 * 1024 * 1024)))
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+_CONTENT_RANGE = re.compile(r"bytes \d+-\d+/(\d+|\*)")
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared keep-alive client, creating it on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=10.0, pool=60.0),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _mib(size: int) -> str:
+    return f"{round(size / (1024 * 1024), 1):g} MiB"
+
+
+class DownloadTooLarge(ValueError):
+    """Raised when a file, or all files of one request together, exceed the download caps"""
+
+
+class DownloadBudget:
+    """Bytes downloaded so far for one chat request, shared by its concurrent downloads"""
+
+    def __init__(self, max_bytes: int = DOWNLOAD_MAX_REQUEST_BYTES):
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    def charge(self, size: int) -> None:
+        self.used += size
+        if self.used > self.max_bytes:
+            raise DownloadTooLarge(f"attachments exceed the {_mib(self.max_bytes)} limit per request")
+
+
+def check_file_size(size: Optional[int], max_bytes: Optional[int] = None) -> None:
+    """Raise DownloadTooLarge if a file's announced size is over the per-file cap"""
+    max_bytes = max_bytes or DOWNLOAD_MAX_FILE_BYTES
+    if size is not None and size > max_bytes:
+        raise DownloadTooLarge(f"file is {_mib(size)}, the limit is {_mib(max_bytes)}")
+
+
+async def fetch_file_info(url: str) -> Tuple[Optional[str], Optional[int]]:
+    """Return the ETag and Content-Length for a file URL, where the server provides them"""
+    try:
+        response = await get_http_client().head(url)
+        if response.is_success:
+            length = response.headers.get("Content-Length")
+            return response.headers.get("ETag"), int(length) if length and length.isdigit() else None
+    except httpx.HTTPError as e:
+        logger.warning(f"HEAD request failed for {url}: {e}")
+    return None, None
+
+
+class Download:
+    """
+    A downloaded file, hashed as it streams in. Held in memory up to
+    DOWNLOAD_SPOOL_BYTES and spilled to a named temp file beyond that, so
+    large files can be handed to worker processes by path. close() removes
+    the temp file.
+    """
+
+    def __init__(self, spool_bytes: int = DOWNLOAD_SPOOL_BYTES):
+        self.size = 0
+        self.truncated = False  # only the first bytes of the file were fetched
+        self.path: Optional[str] = None
+        self._spool_bytes = spool_bytes
+        self._hash = hashlib.sha256()
+        self._buffer = bytearray()
+        self._data: Optional[bytes] = None
+        self._file = None
+
+    def write(self, chunk: bytes) -> None:
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        if self._file is None and len(self._buffer) + len(chunk) > self._spool_bytes:
+            fd, self.path = tempfile.mkstemp(prefix="atlas-download-")
+            self._file = os.fdopen(fd, "wb")
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._buffer += chunk
+
+    def finish(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        else:
+            self._data = bytes(self._buffer)
+            self._buffer = bytearray()
+
+    @property
+    def digest(self) -> str:
+        """Content hash in the same form as file_cache.content_hash"""
+        return "sha256:" + self._hash.hexdigest()
+
+    @property
+    def source(self) -> Union[bytes, str]:
+        """The bytes for small files, the temp file path for spilled ones"""
+        return self.path if self.path is not None else self._data
+
+    def open(self) -> io.BufferedIOBase:
+        return open(self.path, "rb") if self.path is not None else io.BytesIO(self._data)
+
+    def read_bytes(self) -> bytes:
+        with self.open() as f:
+            return f.read()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+        self._data = None
+
+
+async def download(
+    url: str,
+    budget: Optional[DownloadBudget] = None,
+    max_bytes: Optional[int] = None,
+    prefix: bool = False,
+) -> Download:
+    """
+    Stream a file into a Download in fixed-size chunks, enforcing the per-file
+    cap and the request budget as bytes arrive rather than after buffering.
+    With prefix=True a file over the cap is cut at max_bytes instead of
+    rejected, fetched with a range request so the server sends no more than
+    that, and the Download is flagged as truncated.
+    """
+    max_bytes = max_bytes or DOWNLOAD_MAX_FILE_BYTES
+    headers = {"Range": f"bytes=0-{max_bytes - 1}"} if prefix else None
+    result = Download()
+    try:
+        async with get_http_client().stream("GET", url, headers=headers) as response:
+            response.raise_for_status()
+            if response.status_code == 206:
+                # Servers that ignore Range answer 200 with the whole file; that is cut below
+                total = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+                result.truncated = total is None or total.group(1) == "*" or int(total.group(1)) > max_bytes
+            else:
+                length = response.headers.get("Content-Length")
+                if not prefix and length and length.isdigit():
+                    check_file_size(int(length), max_bytes)
+
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_BYTES):
+                if result.size + len(chunk) > max_bytes:
+                    if not prefix:
+                        raise DownloadTooLarge(f"file exceeds the {_mib(max_bytes)} limit")
+                    chunk = chunk[:max_bytes - result.size]
+                    result.truncated = True
+                if budget is not None:
+                    budget.charge(len(chunk))
+                result.write(chunk)
+                if result.truncated and result.size >= max_bytes:
+                    break
+        result.finish()
+    except BaseException:
+        result.close()
+        raise
+    return result
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .metrics import INGEST_JOBS, INGEST_LOOKUPS
+
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept for reuse by chat turns
+INGEST_MAX_JOBS = int(os.getenv("ATLAS_INGEST_MAX_JOBS", "256"))
+INGEST_MAX_ACTIVE = int(os.getenv("ATLAS_INGEST_MAX_ACTIVE", "32"))
+INGEST_TTL_SECONDS = float(os.getenv("ATLAS_INGEST_TTL_SECONDS", "900"))
+
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+
+ProgressListener = Callable[[int, int], None]
+
+
+class IngestionBusy(Exception):
+    """Raised when too many ingestion jobs are already running"""
+
+
+class IngestJob:
+    __slots__ = (
+        "id", "filename", "media_type", "url", "status", "result", "error", "detail",
+        "progress", "created", "finished", "task", "_listeners",
+    )
+
+    def __init__(self, filename: str, media_type: str, url: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.media_type = media_type
+        self.url = url
+        self.status = RUNNING
+        self.result: Any = None
+        self.error: Optional[str] = None
+        # Extra status fields set by the job, e.g. a spreadsheet's sheets
+        self.detail: Dict[str, Any] = {}
+        self.progress: Optional[Tuple[int, int]] = None
+        self.created = time.monotonic()
+        self.finished: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._listeners: List[ProgressListener] = []
+
+    def report(self, done: int, total: int) -> None:
+        """Progress callback for the job's extraction; relayed to chat turns waiting on it"""
+        self.progress = (done, total)
+        for listener in list(self._listeners):
+            listener(done, total)
+
+    def snapshot(self) -> Dict[str, Any]:
+        status = {
+            "id": self.id,
+            "filename": self.filename,
+            "mediaType": self.media_type,
+            "status": self.status,
+            "elapsedSeconds": round((self.finished or time.monotonic()) - self.created, 3),
+        }
+        if self.progress:
+            status["pagesDone"], status["pagesTotal"] = self.progress
+        if self.error:
+            status["error"] = self.error
+        return {**status, **self.detail}
+
+
+class IngestionRegistry:
+    """
+    Background extraction of attachments, started when a file is uploaded
+    instead of when the next chat message references it.
+
+    Jobs are keyed by media type and URL, so an upload is extracted once
+    however often it is ingested; a chat turn referencing it takes the ready
+    result or waits on the running job. Finished jobs are kept for
+    INGEST_TTL_SECONDS, at most INGEST_MAX_JOBS of them; failed jobs are not
+    reused. Runs on the event loop; not thread-safe.
+    """
+
+    def __init__(
+        self,
+        max_jobs: int = INGEST_MAX_JOBS,
+        max_active: int = INGEST_MAX_ACTIVE,
+        ttl: float = INGEST_TTL_SECONDS,
+    ):
+        self.max_jobs = max_jobs
+        self.max_active = max_active
+        self.ttl = ttl
+        self._jobs: "OrderedDict[Tuple[str, str], IngestJob]" = OrderedDict()
+        self._by_id: Dict[str, IngestJob] = {}
+
+    def _active(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == RUNNING)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        finished = [key for key, job in self._jobs.items() if job.finished is not None]
+        excess = len(self._jobs) - self.max_jobs
+        for key in finished:
+            job = self._jobs[key]
+            if excess > 0 or now - job.finished > self.ttl:
+                del self._jobs[key]
+                del self._by_id[job.id]
+                excess -= 1
+
+    def _find(self, media_type: str, url: str) -> Optional[IngestJob]:
+        self._expire()
+        job = self._jobs.get((media_type, url))
+        return None if job is None or job.status == FAILED else job
+
+    def start(
+        self,
+        filename: str,
+        media_type: str,
+        url: str,
+        run: Callable[[IngestJob], Awaitable[Any]],
+    ) -> IngestJob:
+        """Start run(job) in the background unless the file is already ingested or being ingested"""
+        job = self._find(media_type, url)
+        if job is not None:
+            return job
+        if self._active() >= self.max_active:
+            raise IngestionBusy(f"{self.max_active} ingestion jobs already running")
+
+        job = IngestJob(filename, media_type, url)
+        failed = self._jobs.pop((media_type, url), None)
+        if failed is not None:
+            del self._by_id[failed.id]
+        self._jobs[(media_type, url)] = job
+        self._by_id[job.id] = job
+        job.task = asyncio.create_task(self._run(job, run))
+        return job
+
+    async def _run(self, job: IngestJob, run: Callable[[IngestJob], Awaitable[Any]]) -> None:
+        try:
+            job.result = await run(job)
+            job.status = READY
+        except asyncio.CancelledError:
+            job.status, job.error = FAILED, "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Ingestion of {job.filename} failed: {e}")
+            job.status, job.error = FAILED, str(e)
+        finally:
+            job.finished = time.monotonic()
+            job._listeners.clear()
+            INGEST_JOBS.labels(job.status).inc()
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        self._expire()
+        return self._by_id.get(job_id)
+
+    def lookup(self, media_type: str, url: str) -> Optional[IngestJob]:
+        """The ready or running job for an attachment a chat turn references, if any"""
+        job = self._find(media_type, url)
+        INGEST_LOOKUPS.labels("miss" if job is None else job.status).inc()
+        return job
+
+    async def wait(self, job: IngestJob, on_progress: Optional[ProgressListener] = None) -> Any:
+        """
+        A job's result, waiting for it while it runs and relaying its progress.
+        Raises RuntimeError if the job failed; chat turns then extract the file
+        themselves. Cancelling the waiter (e.g. the chat client disconnecting)
+        leaves the job running for the next turn.
+        """
+        if job.status == RUNNING:
+            if on_progress is not None:
+                job._listeners.append(on_progress)
+                if job.progress:
+                    on_progress(*job.progress)
+            try:
+                await asyncio.shield(job.task)
+            finally:
+                if on_progress in job._listeners:
+                    job._listeners.remove(on_progress)
+        if job.status == FAILED:
+            raise RuntimeError(job.error)
+        return job.result
+
+    def stats(self) -> Dict[str, int]:
+        self._expire()
+        counts = {RUNNING: 0, READY: 0, FAILED: 0}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return counts
+
+    async def shutdown(self) -> None:
+        """Cancel running jobs, before the worker pools they use are shut down"""
+        tasks = [job.task for job in self._jobs.values() if job.status == RUNNING and job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+ingestion = IngestionRegistry()
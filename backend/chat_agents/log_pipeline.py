@@ -0,0 +1,162 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+
+LOG_LEVEL = os.getenv("ATLAS_LOG_LEVEL", "INFO").upper()
+# Rotating JSON log file; empty logs to stdout only
+LOG_FILE = os.getenv("ATLAS_LOG_FILE", os.path.join("logs", "atlas_backend.jsonl"))
+LOG_MAX_BYTES = int(os.getenv("ATLAS_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("ATLAS_LOG_BACKUPS", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("ATLAS_LOG_QUEUE_SIZE", "10000"))
+# Above this fill ratio only WARNING and higher are queued
+LOG_SHED_RATIO = 0.8
+# At most one "dropped N records" report per interval while shedding
+DROP_REPORT_INTERVAL_SECONDS = 1.0
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("atlas_request_id", default=None)
+stage_var: ContextVar[Optional[str]] = ContextVar("atlas_stage", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id, stage and any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and value is not None:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        return orjson.dumps(payload, default=str).decode("utf-8")
+
+
+class SheddingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread without blocking. Under pressure it
+    sheds: past LOG_SHED_RATIO of the queue only warnings and errors are
+    queued, and a full queue drops the record. Drops are counted and reported
+    with the next record that gets through, at most once a second.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0  # since the last drop report
+        self.dropped_total = 0
+        self._shed_at = int(log_queue.maxsize * LOG_SHED_RATIO) if log_queue.maxsize > 0 else 0
+        self._lock = threading.Lock()
+        self._reported_at = 0.0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Capture request context on the calling thread; formatting happens on the writer
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        if getattr(record, "stage", None) is None:
+            record.stage = stage_var.get()
+        # Merge args now: they may be mutated by the caller before the writer gets to them
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self._shed_at and record.levelno < logging.WARNING and self.queue.qsize() >= self._shed_at:
+            self._drop()
+            return
+        try:
+            if self.dropped and time.monotonic() - self._reported_at >= DROP_REPORT_INTERVAL_SECONDS:
+                with self._lock:
+                    dropped, self.dropped = self.dropped, 0
+                    self._reported_at = time.monotonic()
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": __name__,
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": f"Dropped {dropped} log records under load",
+                    "dropped": dropped,
+                }))
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._drop()
+
+    def _drop(self) -> None:
+        with self._lock:
+            self.dropped += 1
+            self.dropped_total += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[SheddingQueueHandler] = None
+
+
+def configure_logging() -> None:
+    """
+    Route all logging through one bounded queue to a single writer thread that
+    formats JSON lines to stdout and the rotating log file. Logging calls on
+    the event loop only enqueue. Idempotent; uvicorn's loggers are routed
+    through the same pipeline.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter()
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if LOG_FILE:
+        os.makedirs(os.path.dirname(LOG_FILE) or ".", exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8",
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    _queue_handler = SheddingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records() -> int:
+    return _queue_handler.dropped_total if _queue_handler is not None else 0
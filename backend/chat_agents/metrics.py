@@ -0,0 +1,199 @@
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from .file_cache import file_cache
+from .log_pipeline import dropped_records
+
+
+# Latency buckets spanning sub-second token latency to multi-minute analysis runs
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160, 320)
+
+TIME_TO_FIRST_TOKEN = Histogram(
+    "atlas_chat_time_to_first_token_seconds",
+    "Time from receiving a chat request to the first model text delta",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+STREAM_DURATION = Histogram(
+    "atlas_chat_stream_duration_seconds",
+    "Total duration of a chat stream",
+    buckets=LATENCY_BUCKETS,
+)
+FILE_EXTRACTION = Histogram(
+    "atlas_file_extraction_seconds",
+    "Time spent extracting an attachment (download, cache lookup and parsing)",
+    ["media_type"],
+    buckets=LATENCY_BUCKETS,
+)
+AGENT_RUN = Histogram(
+    "atlas_agent_run_seconds",
+    "Duration of a streamed agent run",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+AGENT_EVENTS = Counter(
+    "atlas_agent_events_total",
+    "Agent stream events by type",
+    ["event_type"],
+)
+TOOL_CALLS = Counter(
+    "atlas_tool_calls_total",
+    "Tool calls made by agents",
+    ["tool"],
+)
+TOOL_CALL_DURATION = Histogram(
+    "atlas_tool_call_seconds",
+    "Time from a tool call item being added to it completing",
+    ["tool"],
+    buckets=LATENCY_BUCKETS,
+)
+STREAM_BYTES = Counter(
+    "atlas_chat_stream_bytes_total",
+    "Bytes written to chat SSE streams",
+)
+RESPONSE_CACHE = Counter(
+    "atlas_response_cache_requests_total",
+    "Chat requests by response cache outcome",
+    ["result"],
+)
+STREAMS_QUEUED = Gauge(
+    "atlas_chat_streams_queued",
+    "Chat requests waiting for an admission slot",
+)
+QUEUE_WAIT = Histogram(
+    "atlas_chat_queue_wait_seconds",
+    "Time chat requests spend waiting for an admission slot",
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_REJECTED = Counter(
+    "atlas_chat_admission_rejected_total",
+    "Chat requests rejected because the admission queue was full",
+)
+INGEST_JOBS = Counter(
+    "atlas_ingest_jobs_total",
+    "Upload-time attachment ingestion jobs by outcome",
+    ["status"],
+)
+INGEST_LOOKUPS = Counter(
+    "atlas_ingest_lookups_total",
+    "Attachments referenced in chat turns by ingestion job state (ready, running or miss)",
+    ["result"],
+)
+STREAMS_CANCELLED = Counter(
+    "atlas_chat_streams_cancelled_total",
+    "Chat streams cancelled because the client disconnected",
+)
+STREAMS_IN_FLIGHT = Gauge(
+    "atlas_chat_streams_in_flight",
+    "Chat streams currently open",
+)
+
+
+class FileCacheCollector:
+    """Exposes the file content cache counters at scrape time"""
+
+    def collect(self):
+        stats = file_cache.stats()
+        lookups = CounterMetricFamily("atlas_file_cache_lookups", "File cache lookups by result", labels=["result"])
+        lookups.add_metric(["memory_hit"], stats["memory_hits"])
+        lookups.add_metric(["disk_hit"], stats["disk_hits"])
+        lookups.add_metric(["miss"], stats["misses"])
+        yield lookups
+
+        evictions = CounterMetricFamily("atlas_file_cache_evictions", "File cache evictions by tier", labels=["tier"])
+        evictions.add_metric(["memory"], stats["memory_evictions"])
+        evictions.add_metric(["disk"], stats["disk_evictions"])
+        yield evictions
+
+        yield GaugeMetricFamily("atlas_file_cache_memory_bytes", "Bytes held in the file cache memory tier", value=stats["memory_bytes"])
+        yield GaugeMetricFamily("atlas_file_cache_memory_entries", "Entries held in the file cache memory tier", value=stats["memory_entries"])
+        yield GaugeMetricFamily("atlas_file_cache_disk_bytes", "Bytes held in the file cache disk tier", value=stats["disk_bytes"])
+
+
+REGISTRY.register(FileCacheCollector())
+
+
+class LogPipelineCollector:
+    """Exposes log records shed by the logging queue under load"""
+
+    def collect(self):
+        yield CounterMetricFamily("atlas_log_records_dropped", "Log records dropped because the log queue was full", value=dropped_records())
+
+
+REGISTRY.register(LogPipelineCollector())
+
+
+def _event_label(ev: Any) -> str:
+    et = getattr(ev, "type", "")
+    if et == "raw_response_event":
+        return getattr(getattr(ev, "data", None), "type", None) or et
+    if et == "run_item_stream_event":
+        return getattr(ev, "name", None) or et
+    return et or "unknown"
+
+
+class RunMetrics:
+    """
+    Per-stream recorder for agent run metrics. Label children are cached on the
+    instance so the per-event cost is a dict lookup and a counter increment.
+    """
+
+    def __init__(self, model: str, request_start: float):
+        self.model = model
+        self.request_start = request_start
+        self.run_start: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self._event_counters: Dict[str, Any] = {}
+        self._tool_starts: Dict[str, tuple] = {}
+        self._tools_used: set = set()
+
+    def run_started(self) -> None:
+        self.run_start = time.perf_counter()
+
+    def text_delta(self) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            TIME_TO_FIRST_TOKEN.labels(self.model).observe(self.first_token_at - self.request_start)
+
+    def event(self, ev: Any) -> None:
+        label = _event_label(ev)
+        counter = self._event_counters.get(label)
+        if counter is None:
+            counter = self._event_counters[label] = AGENT_EVENTS.labels(label)
+        counter.inc()
+
+        if label == "response.output_item.added" or label == "response.output_item.done":
+            item = getattr(getattr(ev, "data", None), "item", None)
+            item_type = getattr(item, "type", "")
+            if not item_type.endswith("_call"):
+                return
+            item_id = getattr(item, "id", None) or id(item)
+            if label == "response.output_item.added":
+                TOOL_CALLS.labels(item_type).inc()
+                self._tools_used.add(item_type)
+                self._tool_starts[item_id] = (item_type, time.perf_counter())
+            else:
+                started = self._tool_starts.pop(item_id, None)
+                if started:
+                    TOOL_CALL_DURATION.labels(started[0]).observe(time.perf_counter() - started[1])
+
+    def used_tool(self, item_type: str) -> bool:
+        return item_type in self._tools_used
+
+    def run_finished(self) -> None:
+        if self.run_start is not None:
+            AGENT_RUN.labels(self.model).observe(time.perf_counter() - self.run_start)
+
+
+async def track_stream(frames: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Count bytes written and open streams for an SSE body iterator"""
+    STREAMS_IN_FLIGHT.inc()
+    try:
+        async for chunk in frames:
+            STREAM_BYTES.inc(len(chunk))
+            yield chunk
+    finally:
+        STREAMS_IN_FLIGHT.dec()
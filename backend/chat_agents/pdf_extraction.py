@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import AsyncIterator, Callable, List, NamedTuple, Optional, Union
+
+
+logger = logging.getLogger(__name__)
+
+PDF_MAX_PAGES = int(os.getenv("ATLAS_PDF_MAX_PAGES", "500"))
+PDF_MAX_CHARS = int(os.getenv("ATLAS_PDF_MAX_CHARS", "400000"))
+PDF_PAGES_PER_TASK = int(os.getenv("ATLAS_PDF_PAGES_PER_TASK", "16"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("ATLAS_PDF_PARALLEL_MIN_PAGES", "32"))
+PDF_WORKERS = int(os.getenv("ATLAS_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class PdfPage(NamedTuple):
+    index: int
+    text: str
+    total_pages: int
+    truncated: bool = False
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    """Return the shared PDF worker pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        # spawn rather than fork: the API process is multi-threaded
+        _pool = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_pdf_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# Raw bytes, or the path of a downloaded file
+PdfSource = Union[bytes, str]
+
+
+def _open_reader(source):
+    import PyPDF2
+
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    return PyPDF2.PdfReader(source)
+
+
+def _count_pages(source) -> int:
+    return len(_open_reader(source).pages)
+
+
+def _extract_page_range(source, start: int, stop: int) -> List[str]:
+    """Extract text for pages [start, stop). Runs in a worker thread or process."""
+    reader = _open_reader(source)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _write_temp_pdf(data: bytes) -> str:
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+
+async def iter_pdf_pages(
+    source: PdfSource,
+    max_pages: int = PDF_MAX_PAGES,
+    max_chars: int = PDF_MAX_CHARS,
+) -> AsyncIterator[PdfPage]:
+    """
+    Yield PDF pages in order as soon as they are extracted.
+
+    Small documents are extracted on a worker thread. Larger ones are split
+    into page ranges and fanned out across the PDF process pool, with the
+    bytes handed over through a temp file rather than pickled per task
+    (a path is passed to the workers as it is).
+    Extraction stops at max_pages pages or max_chars characters; the last
+    page yielded is flagged as truncated when a budget was hit.
+    """
+    loop = asyncio.get_running_loop()
+    total = await asyncio.to_thread(_count_pages, source)
+    page_count = min(total, max_pages)
+
+    temp_path = None
+    if page_count >= PDF_PARALLEL_MIN_PAGES and PDF_WORKERS > 1:
+        if isinstance(source, (bytes, bytearray)):
+            temp_path = await asyncio.to_thread(_write_temp_pdf, source)
+            source = temp_path
+        executor = get_pdf_pool()
+    else:
+        executor = None
+
+    futures = [
+        loop.run_in_executor(executor, _extract_page_range, source, start, min(start + PDF_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    ]
+
+    chars = 0
+    index = 0
+    try:
+        for future in futures:
+            for text in await future:
+                remaining = max_chars - chars
+                if len(text) >= remaining:
+                    yield PdfPage(index, text[:remaining], total, truncated=True)
+                    return
+
+                chars += len(text)
+                last = index == page_count - 1
+                yield PdfPage(index, text, total, truncated=last and page_count < total)
+                index += 1
+    finally:
+        for future in futures:
+            future.cancel()
+        if temp_path:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+async def extract_pdf(
+    source: PdfSource,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    max_pages: int = PDF_MAX_PAGES,
+    max_chars: int = PDF_MAX_CHARS,
+) -> str:
+    """Extract PDF text within the page/char budgets, reporting (pages_done, total_pages) as it goes"""
+    parts = []
+    truncated = False
+    total = 0
+    reported = 0
+
+    async for page in iter_pdf_pages(source, max_pages=max_pages, max_chars=max_chars):
+        parts.append(page.text)
+        total = page.total_pages
+        truncated = page.truncated
+        if on_progress and len(parts) - reported >= PDF_PAGES_PER_TASK:
+            reported = len(parts)
+            on_progress(reported, total)
+
+    if on_progress and len(parts) != reported:
+        on_progress(len(parts), total)
+
+    text = "\n".join(parts).strip()
+    if truncated:
+        text += f"\n[Truncated: extracted {len(parts)} of {total} pages]"
+    return text
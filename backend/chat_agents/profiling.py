@@ -0,0 +1,251 @@
+import asyncio
+import concurrent.futures.thread
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextvars import Context, ContextVar
+from typing import AsyncIterator, Dict, List, Mapping, Optional, Tuple
+
+from .log_pipeline import stage_var
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("ATLAS_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "atlas_profiles"))
+# Fraction of chat requests profiled without being asked to; 0 disables sampling
+PROFILE_SAMPLE_RATE = float(os.getenv("ATLAS_PROFILE_SAMPLE_RATE", "0"))
+# Requests carrying PROFILE_HEADER with this value are always profiled; unset ignores the header
+PROFILE_TOKEN = os.getenv("ATLAS_PROFILE_TOKEN")
+PROFILE_INTERVAL_SECONDS = float(os.getenv("ATLAS_PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_MAX_CONCURRENT = int(os.getenv("ATLAS_PROFILE_MAX_CONCURRENT", "4"))
+PROFILE_HEADER = "X-Atlas-Profile"
+MAX_STACK_DEPTH = 128
+
+_SAFE_ID = re.compile(r"[^A-Za-z0-9_.-]")
+_WORK_ITEM_RUN = concurrent.futures.thread._WorkItem.run.__code__
+
+_active: ContextVar[Optional["RequestProfile"]] = ContextVar("atlas_profile", default=None)
+
+
+def should_profile(headers: Mapping[str, str]) -> bool:
+    """Decide per request; costs one header lookup when profiling is off"""
+    if PROFILE_TOKEN and headers.get(PROFILE_HEADER) == PROFILE_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class RequestProfile:
+    """Folded stack samples and stage timings for one request"""
+
+    def __init__(self, request_id: str, loop: asyncio.AbstractEventLoop):
+        self.request_id = request_id
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        # (name, start, end) relative to started; end is None while open
+        self.stages: List[List] = []
+
+    def stage(self) -> str:
+        """Innermost stage still open, the root of every stack sampled now"""
+        for name, _start, end in reversed(self.stages):
+            if end is None:
+                return name
+        return "request"
+
+    def write(self, directory: str = PROFILE_DIR) -> str:
+        """
+        Write the samples in collapsed-stack format (one 'frame;frame;... count'
+        line per stack, as read by flamegraph.pl, speedscope and inferno) plus
+        a JSON sidecar with the request id, sampling interval and stage timings
+        """
+        os.makedirs(directory, exist_ok=True)
+        stem = f"{time.strftime('%Y%m%dT%H%M%S')}-{_SAFE_ID.sub('_', self.request_id)[:64]}"
+        path = os.path.join(directory, f"{stem}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+
+        meta = {
+            "request_id": self.request_id,
+            "duration_seconds": round((self.finished or time.perf_counter()) - self.started, 4),
+            "interval_seconds": PROFILE_INTERVAL_SECONDS,
+            "samples": self.samples,
+            "stages": [
+                {"stage": name, "start": round(start, 4), "end": None if end is None else round(end, 4)}
+                for name, start, end in self.stages
+            ],
+        }
+        with open(os.path.join(directory, f"{stem}.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        return path
+
+
+class request_stage:
+    """
+    Mark a stage of the current request (e.g. 'extract_files'). Log records
+    emitted inside it carry the stage, one record with its duration is logged
+    on exit, and when the request is profiled the stage is recorded in the
+    profile. Safe to hold across yields of an async generator: nothing is
+    reset through a context var token.
+    """
+
+    __slots__ = ("name", "_profile", "_entry", "_started", "_previous")
+
+    def __init__(self, name: str):
+        self.name = name
+        self._profile = None
+
+    def __enter__(self) -> "request_stage":
+        self._started = time.perf_counter()
+        self._previous = stage_var.get()
+        stage_var.set(self.name)
+        profile = _active.get()
+        if profile is not None:
+            self._profile = profile
+            self._entry = [self.name, self._started - profile.started, None]
+            profile.stages.append(self._entry)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        ended = time.perf_counter()
+        stage_var.set(self._previous)
+        if self._profile is not None:
+            self._entry[2] = ended - self._profile.started
+        logger.info(
+            f"Stage {self.name} {'failed' if exc_type else 'finished'}",
+            extra={"stage": self.name, "duration_ms": round((ended - self._started) * 1000, 2)},
+        )
+
+
+_labels: Dict[object, str] = {}
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for prefix in sorted(sys.path, key=len, reverse=True):
+            if prefix and filename.startswith(prefix + os.sep):
+                filename = filename[len(prefix) + 1:]
+                break
+        # ';' separates frames in the folded format
+        label = f"{code.co_qualname} ({filename}:{code.co_firstlineno})".replace(";", ":")
+        _labels[code] = label
+    return label
+
+
+def _stack(frame) -> Tuple[str, ...]:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+
+def _worker_context(frame) -> Optional[Context]:
+    """The context an executor thread is running a to_thread call in, found from its work item"""
+    while frame is not None:
+        if frame.f_code is _WORK_ITEM_RUN:
+            fn = getattr(frame.f_locals.get("self"), "fn", None)
+            # asyncio.to_thread submits functools.partial(context.run, func, ...)
+            owner = getattr(getattr(fn, "func", None), "__self__", None)
+            return owner if isinstance(owner, Context) else None
+        frame = frame.f_back
+    return None
+
+
+class Sampler:
+    """
+    One background thread that samples every thread's stack while at least one
+    request is being profiled, and attributes each sample to a request through
+    the context of the task (event loop thread) or to_thread call (executor
+    threads) it was taken in. The thread only exists while profiles are active.
+    Work in the PDF and code worker processes is not sampled.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._profiles: List[RequestProfile] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, profile: RequestProfile) -> bool:
+        with self._lock:
+            if len(self._profiles) >= PROFILE_MAX_CONCURRENT:
+                return False
+            self._profiles.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="atlas-profiler", daemon=True)
+                self._thread.start()
+        return True
+
+    def stop(self, profile: RequestProfile) -> None:
+        with self._lock:
+            if profile in self._profiles:
+                self._profiles.remove(profile)
+        profile.finished = time.perf_counter()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while True:
+            # Sampling under the lock means stop() returns only once a profile gets no more samples
+            with self._lock:
+                if not self._profiles:
+                    self._thread = None
+                    return
+                self._sample(me)
+            time.sleep(self.interval)
+
+    def _sample(self, me: int) -> None:
+        loops = {p.loop_thread: p.loop for p in self._profiles}
+        frames = sys._current_frames()
+        for thread_id, frame in frames.items():
+            if thread_id == me:
+                continue
+            if thread_id in loops:
+                task = asyncio.current_task(loops[thread_id])
+                context = task.get_context() if task is not None else None
+            else:
+                context = _worker_context(frame)
+            profile = context.get(_active) if context is not None else None
+            if profile is not None and profile in self._profiles:
+                profile.stacks[(f"request {profile.request_id}", profile.stage()) + _stack(frame)] += 1
+                profile.samples += 1
+
+
+sampler = Sampler()
+
+
+async def profiled_stream(request_id: str, frames: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Profile everything a streamed request does, including tasks and to_thread
+    calls it starts, and write the profile when the stream ends. Wrap the
+    outermost iterator so every task the stream creates inherits the profile.
+    """
+    profile = RequestProfile(request_id, asyncio.get_running_loop())
+    if not sampler.start(profile):
+        logger.info(f"Profiling skipped for request {request_id}: {PROFILE_MAX_CONCURRENT} already active")
+        async for chunk in frames:
+            yield chunk
+        return
+
+    # Set for the rest of this request's task; not reset, the task ends with the stream
+    _active.set(profile)
+    try:
+        async for chunk in frames:
+            yield chunk
+    finally:
+        sampler.stop(profile)
+        # A few KiB; written inline since the stream may be closing because it was cancelled
+        path = profile.write()
+        logger.info(f"Wrote profile for request {request_id} ({profile.samples} samples) to {path}")
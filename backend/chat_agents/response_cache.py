@@ -0,0 +1,125 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+
+from .sse import SSE_COALESCE_BYTES, START_STEP, TEXT_START, TEXT_END, END_STEP, text_delta_frame
+
+
+# 0 disables the cache
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("ATLAS_RESPONSE_CACHE_TTL_SECONDS", "0"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("ATLAS_RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Questions whose answer depends on what is true right now are never served from cache
+FRESHNESS_PATTERN = re.compile(
+    os.getenv(
+        "ATLAS_RESPONSE_CACHE_FRESHNESS_PATTERN",
+        r"\b(latest|newest|recent(ly)?|current(ly)?|today|tonight|yesterday|tomorrow|this (week|month|year)|now|news|update[sd]?|20\d\d)\b",
+    ),
+    re.IGNORECASE,
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def response_cache_key(messages: List[Dict[str, Any]], model: str, instructions: str, tools: Tuple[str, ...]) -> str:
+    """Key on the normalized history plus everything else that shapes the answer"""
+    payload = {
+        "model": model,
+        "instructions": instructions,
+        "tools": list(tools),
+        "messages": [
+            [str(m.get("role", "user")).lower(), normalize_text(str(m.get("content", "")))] for m in messages
+        ],
+    }
+    return hashlib.sha256(orjson.dumps(payload)).hexdigest()
+
+
+def needs_fresh_answer(messages: List[Dict[str, Any]]) -> bool:
+    """True when the latest user message asks for current information"""
+    for m in reversed(messages):
+        if str(m.get("role", "user")).lower() == "user":
+            return bool(FRESHNESS_PATTERN.search(str(m.get("content", ""))))
+    return False
+
+
+class ResponseCache:
+    """
+    LRU cache of final answer text with a TTL, bounded by total UTF-8 size.
+    Hits are replayed as the same SSE frame sequence a live run produces.
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL_SECONDS, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, text, size = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return text
+
+    def put(self, key: str, text: str) -> None:
+        size = len(text.encode("utf-8"))
+        if not self.enabled or size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (time.monotonic() + self.ttl, text, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Drop one entry, or everything when key is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._bytes -= entry[2]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes}
+
+
+def replay_frames(text: str, chunk_chars: int = SSE_COALESCE_BYTES * 16) -> Iterator[bytes]:
+    """The frame sequence of a live run for a cached answer, in a few large deltas"""
+    yield START_STEP
+    yield TEXT_START
+    for i in range(0, len(text), chunk_chars):
+        yield text_delta_frame(text[i:i + chunk_chars])
+    yield TEXT_END
+    yield END_STEP
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,218 @@
+import bisect
+import logging
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .dataset_store import dataset_store, is_csv
+
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CACHE_SESSIONS = 128
+
+_NON_WORD = re.compile(r"[^0-9A-Z]+")
+
+
+def normalize_name(value: Any) -> str:
+    """Uppercase with runs of spaces/punctuation collapsed to '_', as standardize_file names columns"""
+    return _NON_WORD.sub("_", str(value).upper()).strip("_")
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ColumnLocation(NamedTuple):
+    file: str
+    sheet: Optional[str]  # None for CSV files
+    column: str
+
+
+class CatalogMatch(NamedTuple):
+    location: ColumnLocation
+    kind: str  # "column" or "value"
+    key: str
+    score: float
+
+
+class SchemaCatalog:
+    """
+    Inverted index over the columns of a set of datasets.
+
+    Normalized column names and sampled categorical values map to the
+    (file, sheet, column) locations that contain them. Exact lookups are a
+    dict access; prefix lookups bisect a sorted key list; fuzzy lookups go
+    through a trigram index, so only keys sharing trigrams with the query are
+    scored.
+    """
+
+    def __init__(self):
+        self._columns: Dict[str, List[ColumnLocation]] = defaultdict(list)
+        self._values: Dict[str, List[ColumnLocation]] = defaultdict(list)
+        self._words: Dict[str, Set[str]] = defaultdict(set)
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+        self._features: Dict[str, Any] = {}
+        self._sorted_keys: List[str] = []
+
+    def add_dataset(self, filename: str, sheets: List[Dict[str, Any]], csv: bool) -> None:
+        """Index one dataset's catalog entries (see DatasetStore.catalog)"""
+        for sheet in sheets:
+            sheet_name = None if csv else sheet["sheet"]
+            names = [column["name"] for column in sheet["columns"]]
+            if csv:
+                self._features[filename] = names
+            else:
+                self._features.setdefault(filename, {})[sheet_name] = names
+
+            for column in sheet["columns"]:
+                location = ColumnLocation(filename, sheet_name, column["name"])
+                self._add(self._columns, normalize_name(column["name"]), location)
+                for value in column.get("values", ()):
+                    self._add(self._values, normalize_name(value), location)
+
+        self._sorted_keys = sorted(set(self._columns) | set(self._values))
+
+    def _add(self, index: Dict[str, List[ColumnLocation]], key: str, location: ColumnLocation) -> None:
+        if not key:
+            return
+        if location not in index[key]:
+            index[key].append(location)
+        for word in key.split("_"):
+            self._words[word].add(key)
+        for gram in _trigrams(key):
+            self._trigrams[gram].add(key)
+
+    def _matches(self, key: str, score: float) -> List[CatalogMatch]:
+        return [CatalogMatch(loc, "column", key, score) for loc in self._columns.get(key, ())] + [
+            CatalogMatch(loc, "value", key, score) for loc in self._values.get(key, ())
+        ]
+
+    def lookup(self, term: str) -> List[CatalogMatch]:
+        """Exact match on a normalized column name or categorical value"""
+        return self._matches(normalize_name(term), 1.0)
+
+    def prefix(self, term: str, limit: int = 20) -> List[CatalogMatch]:
+        key = normalize_name(term)
+        if not key:
+            return []
+        matches: List[CatalogMatch] = []
+        i = bisect.bisect_left(self._sorted_keys, key)
+        while i < len(self._sorted_keys) and self._sorted_keys[i].startswith(key) and len(matches) < limit:
+            candidate = self._sorted_keys[i]
+            matches.extend(self._matches(candidate, len(key) / len(candidate)))
+            i += 1
+        return matches[:limit]
+
+    def fuzzy(self, term: str, limit: int = 10, cutoff: float = 0.4) -> List[CatalogMatch]:
+        """Keys ranked by trigram similarity, tolerant of typos, abbreviations and word order"""
+        key = normalize_name(term)
+        if not key:
+            return []
+        grams = _trigrams(key)
+        shared: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for candidate in self._trigrams.get(gram, ()):
+                shared[candidate] += 1
+
+        scored = []
+        for candidate, count in shared.items():
+            score = count / (len(grams) + len(_trigrams(candidate)) - count)
+            if score >= cutoff:
+                scored.append((score, candidate))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+
+        matches: List[CatalogMatch] = []
+        for score, candidate in scored:
+            matches.extend(self._matches(candidate, score))
+            if len(matches) >= limit:
+                break
+        return matches[:limit]
+
+    def search(self, term: str, limit: int = 10) -> List[CatalogMatch]:
+        """Exact, whole-word, prefix and fuzzy matches, best first, one entry per location and kind"""
+        key = normalize_name(term)
+        found = self.lookup(term)
+        for candidate in self._words.get(key, ()):
+            found.extend(self._matches(candidate, 0.9 * len(key) / len(candidate)))
+        found.extend(self.prefix(term, limit))
+        found.extend(self.fuzzy(term, limit))
+
+        best: Dict[Tuple[ColumnLocation, str], CatalogMatch] = {}
+        for match in found:
+            current = best.get((match.location, match.kind))
+            if current is None or match.score > current.score:
+                best[(match.location, match.kind)] = match
+        return sorted(best.values(), key=lambda m: (-m.score, m.kind != "column", m.location))[:limit]
+
+    def match_text(self, text: str, limit: int = 20) -> List[CatalogMatch]:
+        """Columns whose names or values are mentioned in free text, e.g. a user question"""
+        words = [w for w in normalize_name(text).split("_") if len(w) >= 3]
+        # Adjacent word pairs catch multi-word names such as PAID_AMOUNT
+        terms = words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+        found: Dict[Tuple[ColumnLocation, str], CatalogMatch] = {}
+        for term in terms:
+            for match in self.lookup(term) + [
+                m for candidate in self._words.get(term, ()) for m in self._matches(candidate, 0.8)
+            ]:
+                key = (match.location, match.kind)
+                if key not in found or match.score > found[key].score:
+                    found[key] = match
+        return sorted(found.values(), key=lambda m: (-m.score, m.kind != "column", m.location))[:limit]
+
+    def features(self) -> Dict[str, Any]:
+        """Column names in the shape of convert_to_features_list: file -> columns or file -> {sheet -> columns}"""
+        return self._features
+
+    def words(self) -> Set[str]:
+        """Uppercase file, sheet and column names, as convert_features_list_to_array collects them"""
+        words: Set[str] = set()
+        for filename, item in self._features.items():
+            words.add(filename.upper())
+            sheets = item.items() if isinstance(item, dict) else [(None, item)]
+            for sheet, columns in sheets:
+                if sheet is not None:
+                    words.add(str(sheet).upper())
+                words.update(str(column).upper() for column in columns)
+        return words
+
+
+def format_matches(matches: Iterable[CatalogMatch]) -> str:
+    lines = []
+    for match in matches:
+        where = match.location.file if match.location.sheet is None else f"{match.location.file}/{match.location.sheet}"
+        detail = f" (contains value {match.key})" if match.kind == "value" else ""
+        lines.append(f"- {where}: {match.location.column}{detail}")
+    return "\n".join(lines)
+
+
+_session_catalogs: "OrderedDict[Tuple, SchemaCatalog]" = OrderedDict()
+_session_catalogs_lock = threading.Lock()
+
+
+def session_catalog(session_id: str) -> SchemaCatalog:
+    """
+    The catalog over a conversation's datasets. Catalog entries are computed
+    once per dataset at ingest; the merged index is cached per set of datasets
+    and rebuilt only when the conversation gains an upload.
+    """
+    index = dataset_store.session_index(session_id)
+    key = tuple(sorted(index.items()))
+    with _session_catalogs_lock:
+        catalog = _session_catalogs.get(key)
+        if catalog is not None:
+            _session_catalogs.move_to_end(key)
+            return catalog
+
+    catalog = SchemaCatalog()
+    for filename, dataset_id in index.items():
+        csv = is_csv(dataset_store.manifest(dataset_id))
+        catalog.add_dataset(filename, dataset_store.catalog(dataset_id), csv)
+
+    with _session_catalogs_lock:
+        _session_catalogs[key] = catalog
+        while len(_session_catalogs) > CATALOG_CACHE_SESSIONS:
+            _session_catalogs.popitem(last=False)
+    return catalog
@@ -0,0 +1,275 @@
+import codecs
+import logging
+import posixpath
+import random
+import zipfile
+from xml.etree import ElementTree
+from itertools import islice
+from typing import Iterator, List, NamedTuple, Optional
+
+
+logger = logging.getLogger(__name__)
+
+XLSX = "xlsx"
+XLS = "xls"
+CSV = "csv"
+
+_ZIP_MAGIC = b"PK\x03\x04"
+_OLE2_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+CSV_SHEET_NAME = "data"
+
+
+class UnsupportedSpreadsheet(ValueError):
+    """Raised when file contents are neither a workbook nor delimited text"""
+
+
+def detect_format(head: bytes, path: Optional[str] = None) -> str:
+    """
+    Identify a spreadsheet from its leading bytes: a zip container holding
+    xl/workbook.xml is OOXML, an OLE2 compound file is legacy .xls, and
+    anything that decodes as text is treated as CSV
+    """
+    if head.startswith(_ZIP_MAGIC):
+        if path is not None:
+            with zipfile.ZipFile(path) as archive:
+                if not any(name.startswith("xl/workbook") for name in archive.namelist()):
+                    raise UnsupportedSpreadsheet("zip file is not an Excel workbook")
+        return XLSX
+    if head.startswith(_OLE2_MAGIC):
+        return XLS
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sniffed prefix is still text
+        if e.start < len(head) - 3:
+            try:
+                head.decode("cp1252")
+            except UnicodeDecodeError:
+                raise UnsupportedSpreadsheet("file is neither a workbook nor text") from None
+    if b"\x00" in head:
+        raise UnsupportedSpreadsheet("file is neither a workbook nor text")
+    return CSV
+
+
+def _text_encoding(path: str) -> str:
+    """
+    Encoding for reading a CSV: UTF-8 if the whole file decodes as UTF-8,
+    otherwise cp1252, the only other text detect_format accepts
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        try:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                decoder.decode(chunk)
+        except UnicodeDecodeError:
+            return "cp1252"
+    # A trailing partial character (e.g. a prefix-fetched file) is not checked
+    return "utf8"
+
+
+class SheetInfo(NamedTuple):
+    name: str
+    rows: Optional[int]  # data rows, excluding the header; None when the file does not record it
+    columns: Optional[int]
+
+
+def frame_to_table(df):
+    """Convert a parsed DataFrame to Arrow, stringifying columns Arrow cannot type"""
+    import pyarrow as pa
+
+    df = df.rename(columns=lambda c: str(c))
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        mixed = df.select_dtypes(include=["object"]).columns
+        df = df.astype({col: "string" for col in mixed})
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _header_names(values) -> List[str]:
+    """Column names as pandas would assign them: blanks become 'Unnamed: i', duplicates get '.n'"""
+    names, seen = [], {}
+    for i, value in enumerate(values):
+        name = f"Unnamed: {i}" if value is None or str(value).strip() == "" else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _xlsx_dimension(archive: zipfile.ZipFile, part: str):
+    """(data rows, columns) from a worksheet's <dimension> element, read without touching its cells"""
+    from openpyxl.utils.cell import range_boundaries
+
+    with archive.open(part) as source:
+        for _event, element in ElementTree.iterparse(source, events=("start",)):
+            name = _local_name(element.tag)
+            if name == "dimension":
+                min_col, min_row, max_col, max_row = range_boundaries(element.get("ref"))
+                return max(0, max_row - min_row), max_col - min_col + 1
+            if name == "sheetData":
+                # Written without dimensions (common for streamed exports); unknown until read
+                return None, None
+    return 0, 0
+
+
+def _xlsx_sheets(path: str) -> List[SheetInfo]:
+    """
+    Worksheet names and dimensions straight from the package parts. openpyxl
+    computes the same on load, but scans the entire sheet when a file has no
+    <dimension> element, which defeats lazy loading for large exported workbooks.
+    """
+    with zipfile.ZipFile(path) as archive:
+        targets = {
+            rel.get("Id"): rel.get("Target")
+            for rel in ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        }
+        infos = []
+        for element in ElementTree.fromstring(archive.read("xl/workbook.xml")).iter():
+            if _local_name(element.tag) != "sheet":
+                continue
+            rel_id = next(value for key, value in element.attrib.items() if _local_name(key) == "id")
+            target = targets[rel_id]
+            if "worksheets/" not in target:
+                continue  # chartsheets and dialog sheets hold no rows
+            part = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+            infos.append(SheetInfo(element.get("name"), *_xlsx_dimension(archive, part)))
+        return infos
+
+
+class SpreadsheetReader:
+    """
+    Lazy reader for CSV and Excel files on disk.
+
+    Workbooks are opened with openpyxl in read-only mode, which streams each
+    sheet's XML instead of building the whole workbook in memory. Sheet lists
+    and dimensions come from workbook metadata; rows are only parsed when a
+    sheet is iterated, previewed or loaded, one sheet at a time.
+    """
+
+    def __init__(self, path: str, fmt: Optional[str] = None):
+        self.path = path
+        if fmt is None:
+            with open(path, "rb") as f:
+                fmt = detect_format(f.read(2048), path)
+        self.format = fmt
+        self._workbook = None
+        self._encoding: Optional[str] = None
+
+    def __enter__(self) -> "SpreadsheetReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._workbook is not None and hasattr(self._workbook, "close"):
+            self._workbook.close()
+        self._workbook = None
+
+    def _open_workbook(self):
+        if self._workbook is None:
+            if self.format == XLSX:
+                import openpyxl
+
+                self._workbook = openpyxl.load_workbook(self.path, read_only=True, data_only=True)
+            else:
+                import pandas as pd
+
+                # Legacy .xls has no streaming reader; pandas (xlrd) loads one sheet per call
+                self._workbook = pd.ExcelFile(self.path)
+        return self._workbook
+
+    def sheets(self) -> List[SheetInfo]:
+        """Every sheet with its row and column counts, without reading cell data"""
+        if self.format == CSV:
+            # Counting CSV rows means parsing quoting, so it is left to the full read
+            return [SheetInfo(CSV_SHEET_NAME, None, len(self.header(CSV_SHEET_NAME)))]
+
+        if self.format == XLS:
+            return [SheetInfo(str(name), None, None) for name in self._open_workbook().sheet_names]
+
+        try:
+            return _xlsx_sheets(self.path)
+        except (KeyError, StopIteration, ElementTree.ParseError, ValueError) as e:
+            logger.warning(f"Falling back to openpyxl for sheet dimensions of {self.path}: {e}")
+        return [
+            SheetInfo(ws.title, max(0, ws.max_row - ws.min_row) if ws.max_row else None, ws.max_column)
+            for ws in self._open_workbook().worksheets
+        ]
+
+    def _csv_read_options(self):
+        import pyarrow.csv as pa_csv
+
+        # pyarrow reads UTF-8 only; other text would come back as binary columns
+        if self._encoding is None:
+            self._encoding = _text_encoding(self.path)
+        return pa_csv.ReadOptions(encoding=self._encoding)
+
+    def _raw_rows(self, sheet: str) -> Iterator[tuple]:
+        if self.format == CSV:
+            import pyarrow.csv as pa_csv
+
+            reader = pa_csv.open_csv(self.path, read_options=self._csv_read_options())
+            yield tuple(reader.schema.names)
+            for batch in reader:
+                yield from zip(*(column.to_pylist() for column in batch.columns))
+        elif self.format == XLSX:
+            yield from self._open_workbook()[sheet].iter_rows(values_only=True)
+        else:
+            df = self._open_workbook().parse(sheet, header=None)
+            yield from df.itertuples(index=False, name=None)
+
+    def header(self, sheet: str) -> List[str]:
+        first = next(iter(self._raw_rows(sheet)), ())
+        return _header_names(first)
+
+    def iter_rows(self, sheet: str, start: int = 0, stop: Optional[int] = None) -> Iterator[tuple]:
+        """Data rows start..stop of a sheet (header excluded), parsed on demand"""
+        rows = self._raw_rows(sheet)
+        width = len(_header_names(next(rows, ())))
+        for row in islice(rows, start, stop):
+            # Streamed rows can be ragged; pad/trim to the header width
+            if len(row) != width:
+                row = (tuple(row) + (None,) * width)[:width]
+            yield row
+
+    def preview(self, sheet: str, rows: int = 5):
+        """The first rows of a sheet as a DataFrame"""
+        return self._frame(sheet, self.iter_rows(sheet, 0, rows))
+
+    def sample(self, sheet: str, rows: int, seed: int = 0):
+        """A uniform random sample of rows (reservoir sampling in one pass, bounded memory)"""
+        rng = random.Random(seed)
+        reservoir: List[tuple] = []
+        for i, row in enumerate(self.iter_rows(sheet)):
+            if i < rows:
+                reservoir.append(row)
+            else:
+                j = rng.randint(0, i)
+                if j < rows:
+                    reservoir[j] = row
+        return self._frame(sheet, reservoir)
+
+    def read_table(self, sheet: str, stop: Optional[int] = None):
+        """Load one sheet (or its first stop rows) as an Arrow table"""
+        if self.format == CSV and stop is None:
+            import pyarrow.csv as pa_csv
+
+            return pa_csv.read_csv(self.path, read_options=self._csv_read_options())
+        return frame_to_table(self._frame(sheet, self.iter_rows(sheet, 0, stop)))
+
+    def _frame(self, sheet: str, rows):
+        import pandas as pd
+
+        df = pd.DataFrame.from_records(list(rows), columns=self.header(sheet))
+        # Match read_excel's inference for columns openpyxl returns as mixed objects
+        return df.infer_objects()
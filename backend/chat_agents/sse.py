@@ -0,0 +1,103 @@
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+import orjson
+
+
+SSE_COALESCE_SECONDS = float(os.getenv("ATLAS_SSE_COALESCE_MS", "15")) / 1000
+SSE_COALESCE_BYTES = int(os.getenv("ATLAS_SSE_COALESCE_BYTES", "256"))
+
+IDLE = object()
+
+
+def frame(payload: Dict[str, Any]) -> bytes:
+    """Encode one event as an SSE data frame"""
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+# Fixed frames are built once; per-token frames only encode the delta string
+START_STEP = frame({"type": "start-step"})
+TEXT_START = frame({"type": "text-start"})
+TEXT_END = frame({"type": "text-end"})
+END_STEP = frame({"type": "end-step"})
+
+_TEXT_DELTA_PREFIX = b'data: {"type":"text-delta","delta":'
+_FRAME_SUFFIX = b"}\n\n"
+
+
+def text_delta_frame(text: str) -> bytes:
+    return _TEXT_DELTA_PREFIX + orjson.dumps(text) + _FRAME_SUFFIX
+
+
+def error_frame(message: str) -> bytes:
+    return frame({"type": "error", "message": message})
+
+
+class DeltaCoalescer:
+    """
+    Merges consecutive text deltas into one text-delta frame.
+
+    A frame is released once the buffered text reaches max_bytes or the oldest
+    buffered delta is older than window seconds; callers use remaining() to wake
+    up and flush when no further delta arrives in time.
+    """
+
+    def __init__(self, window: float = SSE_COALESCE_SECONDS, max_bytes: int = SSE_COALESCE_BYTES):
+        self.window = window
+        self.max_bytes = max_bytes
+        self._parts = []
+        self._size = 0
+        self._started = 0.0
+
+    def add(self, text: str) -> Optional[bytes]:
+        if not self._parts:
+            self._started = time.monotonic()
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.max_bytes or time.monotonic() - self._started >= self.window:
+            return self.flush()
+        return None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the buffered text must be flushed, or None if nothing is buffered"""
+        if not self._parts:
+            return None
+        return max(0.0, self._started + self.window - time.monotonic())
+
+    def flush(self) -> Optional[bytes]:
+        if not self._parts:
+            return None
+        text = self._parts[0] if len(self._parts) == 1 else "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        return text_delta_frame(text)
+
+
+async def with_deadline(source: AsyncIterator[Any], timeout: Callable[[], Optional[float]]) -> AsyncIterator[Any]:
+    """
+    Iterate source, yielding IDLE whenever timeout() seconds pass with no new item
+    (timeout() returning None waits indefinitely). The pending read is carried over
+    rather than cancelled, so no upstream item is ever lost.
+    """
+    iterator = source.__aiter__()
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=timeout())
+            if not done:
+                yield IDLE
+                continue
+
+            finished, pending = pending, None
+            try:
+                item = finished.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        if pending is not None:
+            pending.cancel()
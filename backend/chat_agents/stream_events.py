@@ -0,0 +1,30 @@
+from typing import Any, AsyncIterator
+
+
+TEXT_DELTA_EVENT_TYPES = ("text.delta", "response.text.delta", "agent.output_text.delta")
+ERROR_EVENT_TYPES = ("error", "agent.error", "run.error")
+
+
+def text_delta(ev: Any) -> str:
+    """Return the text delta carried by a Runner.run_streamed event, or "" if it carries none"""
+    et = getattr(ev, "type", "")
+
+    # Handle raw_response_event with ResponseTextDeltaEvent
+    if et == "raw_response_event":
+        data = getattr(ev, "data", None)
+        if data and 'ResponseTextDeltaEvent' in str(data.__class__):
+            return getattr(data, "delta", "") or ""
+        return ""
+
+    if et in TEXT_DELTA_EVENT_TYPES:
+        return getattr(ev, "delta", None) or getattr(ev, "text", "") or ""
+
+    return ""
+
+
+async def text_deltas(streamed) -> AsyncIterator[str]:
+    """Yield just the text deltas of a streamed run"""
+    async for ev in streamed.stream_events():
+        delta = text_delta(ev)
+        if delta:
+            yield delta
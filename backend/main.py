@@ -1,18 +1,50 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 from typing import List, Any, Dict
-import logging
+import hmac
 import os
+import uuid
 from dotenv import load_dotenv
 
-from .chat_agents.chat import stream_chat_py
+from .chat_agents.admission import Overloaded, admission, admitted_stream, cancel_on_disconnect
+from .chat_agents.agent_registry import agent_registry
+from .chat_agents.chat import start_ingestion, stream_chat_py
+from .chat_agents.file_cache import file_cache
+from .chat_agents.file_fetch import close_http_client
+from .chat_agents.ingestion import IngestionBusy, ingestion
+from .chat_agents.log_pipeline import configure_logging, request_id_var
+from .chat_agents.metrics import track_stream
+from .chat_agents.response_cache import response_cache
+from .chat_agents.pdf_extraction import shutdown_pdf_pool
+from .chat_agents.profiling import profiled_stream, should_profile
+from .chat_agents.data_analyst_agent.worker_pool import get_code_pool, shutdown_code_pool
 
 
-# Configure simple logging
-logging.basicConfig(level=logging.INFO, format='%(message)s')
+# Value of ADMIN_HEADER required by admin endpoints; unset disables them
+ADMIN_TOKEN = os.getenv("ATLAS_ADMIN_TOKEN")
+ADMIN_HEADER = "X-Atlas-Admin-Token"
 
-app = FastAPI()
+# JSON logs through a bounded queue and one writer thread, so logging never blocks the event loop
+configure_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build agents and tools once instead of per request
+    agent_registry.warm()
+    # Start code workers now so their library imports overlap with startup
+    get_code_pool()
+    yield
+    await ingestion.shutdown()
+    # Release pooled keep-alive connections used for attachment downloads
+    await close_http_client()
+    shutdown_pdf_pool()
+    shutdown_code_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 
 
@@ -20,14 +52,88 @@ class ChatRequest(BaseModel):
     messages: List[Dict[str, Any]]
     selectedChatModel: str
     requestHints: Dict[str, Any]
+    chatId: str | None = None
+    userId: str | None = None
+    priority: str | None = None
 
 @app.post("/api/chat")
-async def chat_endpoint(chat_request: ChatRequest):
+async def chat_endpoint(chat_request: ChatRequest, request: Request):
+    try:
+        ticket = admission.enqueue(chat_request.userId, chat_request.priority)
+    except Overloaded as e:
+        return JSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": "5"})
+
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    # Inherited by the stream and every task it starts, so their log records carry the id
+    request_id_var.set(request_id)
+    frames = admitted_stream(ticket, stream_chat_py(
+        chat_request.messages,
+        chat_request.selectedChatModel,
+        chat_request.requestHints,
+        chat_request.chatId,
+    ))
+    frames = track_stream(cancel_on_disconnect(request.receive, frames))
+    if should_profile(request.headers):
+        # Outermost, so the tasks and threads the stream starts are attributed to it
+        frames = profiled_stream(request_id, frames)
     return StreamingResponse(
-        stream_chat_py(
-            chat_request.messages,
-            chat_request.selectedChatModel,
-            chat_request.requestHints
-        ),
+        frames,
         media_type="text/event-stream",
+        # Frames are already coalesced; ask proxies not to re-buffer them
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Request-ID": request_id},
+        # Also frees the slot when the client leaves before the body is read and the stream never starts
+        background=BackgroundTask(admission.release, ticket),
     )
+
+class IngestRequest(BaseModel):
+    url: str
+    filename: str
+    mediaType: str
+
+@app.post("/api/ingest", status_code=202)
+async def ingest_endpoint(ingest_request: IngestRequest, request: Request):
+    # Called on upload: extraction runs in the background and the chat turn reuses it
+    request_id_var.set(request.headers.get("X-Request-ID") or uuid.uuid4().hex)
+    try:
+        job = start_ingestion(ingest_request.filename, ingest_request.mediaType, ingest_request.url)
+    except IngestionBusy as e:
+        return JSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": "5"})
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=415)
+    return job.snapshot()
+
+@app.get("/api/ingest/stats")
+async def ingest_stats():
+    return ingestion.stats()
+
+@app.get("/api/ingest/{job_id}")
+async def ingest_status(job_id: str):
+    job = ingestion.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Unknown or expired ingestion job"}, status_code=404)
+    return job.snapshot()
+
+@app.get("/api/file-cache/stats")
+async def file_cache_stats():
+    return file_cache.stats()
+
+@app.get("/api/admission/stats")
+async def admission_stats():
+    return admission.stats()
+
+@app.get("/api/response-cache/stats")
+async def response_cache_stats():
+    return {"enabled": response_cache.enabled, **response_cache.stats()}
+
+@app.delete("/api/response-cache")
+async def clear_response_cache(request: Request):
+    # Wipes the cache shared by every user, so only operators may call it
+    supplied = request.headers.get(ADMIN_HEADER, "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    response_cache.invalidate()
+    return {"cleared": True}
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
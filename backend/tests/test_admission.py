@@ -0,0 +1,43 @@
+import asyncio
+
+from backend import main
+from backend.chat_agents import admission as admission_module
+from backend.chat_agents.admission import AdmissionController
+
+
+BODY = b'{"messages": [], "selectedChatModel": "chat-model", "requestHints": {}, "userId": "u1"}'
+
+
+async def _disconnect_before_body(app) -> None:
+    """One /api/chat request whose client disconnects before the first body chunk is read"""
+    requests = [{"type": "http.request", "body": BODY, "more_body": False}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        await asyncio.sleep(0)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/api/chat", "raw_path": b"/api/chat", "root_path": "",
+        "query_string": b"", "headers": [(b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 8000),
+    }
+    await app(scope, receive, send)
+
+
+def test_disconnect_before_first_body_chunk_releases_slot(monkeypatch):
+    controller = AdmissionController(max_active=1, max_per_user=1, max_queued=4)
+    monkeypatch.setattr(main, "admission", controller)
+    monkeypatch.setattr(admission_module, "admission", controller)
+
+    async def run():
+        for _ in range(3):
+            await asyncio.wait_for(_disconnect_before_body(main.app), 5)
+            assert controller.stats()["active"] == 0
+            assert controller.stats()["queued"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,42 @@
+import pyarrow as pa
+
+from backend.chat_agents.spreadsheet_reader import CSV, SpreadsheetReader
+
+
+def _write_cp1252_csv(path, padding_rows=0):
+    rows = ["Név,City,Count"] + [f"pad{i},Oakland,{i}" for i in range(padding_rows)] + ["José,Zürich,1", "Zoë,Málaga,2"]
+    path.write_bytes("\n".join(rows).encode("cp1252") + b"\n")
+
+
+def test_cp1252_csv_reads_as_text(tmp_path):
+    source = tmp_path / "people.csv"
+    _write_cp1252_csv(source)
+
+    with SpreadsheetReader(str(source)) as reader:
+        assert reader.format == CSV
+        assert reader.header("data") == ["Név", "City", "Count"]
+        assert list(reader.iter_rows("data")) == [("José", "Zürich", 1), ("Zoë", "Málaga", 2)]
+        table = reader.read_table("data")
+
+    assert table.schema.field("Név").type == pa.string()
+    assert table.column("City").to_pylist() == ["Zürich", "Málaga"]
+
+
+def test_cp1252_after_sniffed_prefix(tmp_path):
+    # The first non-ASCII byte is well past the bytes detect_format looks at
+    source = tmp_path / "late.csv"
+    _write_cp1252_csv(source, padding_rows=500)
+
+    with SpreadsheetReader(str(source)) as reader:
+        table = reader.read_table("data")
+
+    assert table.schema.field("City").type == pa.string()
+    assert table.column("City").to_pylist()[-2:] == ["Zürich", "Málaga"]
+
+
+def test_utf8_csv_unchanged(tmp_path):
+    source = tmp_path / "utf8.csv"
+    source.write_text("City\nZürich\n", encoding="utf-8")
+
+    with SpreadsheetReader(str(source)) as reader:
+        assert reader.read_table("data").column("City").to_pylist() == ["Zürich"]
@@ -0,0 +1,43 @@
+import pytest
+
+from backend.chat_agents.data_analyst_agent.utils import (
+    IncrementalJSONExtractor, IncrementalPythonExtractor, extract_json, extract_python,
+)
+
+
+PYTHON_CASES = [
+    "```python\ndef main():\n    return 1\n```",
+    "text\n```python\n\n\nx = 1\n```\nmore",
+    "```python\n\n```",
+    "```python\n \n```",
+    "```python\n\n```\nx\n```",
+    "```python x\n```python\ny\n```",
+]
+
+
+def _feed_split(extractor, text, i, j):
+    blocks = []
+    for part in (text[:i], text[i:j], text[j:]):
+        blocks += extractor.feed(part)
+    return blocks + extractor.finish()
+
+
+@pytest.mark.parametrize("text", PYTHON_CASES)
+def test_python_extractor_matches_extract_python_at_every_split(text):
+    expected = extract_python(text)
+    for i in range(len(text) + 1):
+        for j in range(i, len(text) + 1):
+            blocks = _feed_split(IncrementalPythonExtractor(), text, i, j)
+            assert blocks[:1] == [expected], (i, j)
+
+
+def test_python_extractor_empty_block():
+    extractor = IncrementalPythonExtractor()
+    assert extractor.feed("```python\n\n```") == []
+    assert extractor.finish() == [""] == [extract_python("```python\n\n```")]
+
+
+def test_json_extractor_yields_objects_as_they_close():
+    extractor = IncrementalJSONExtractor()
+    assert extractor.feed('{"id": "s1", "q": "a {b}"}\n{"id": ') == [{"id": "s1", "q": "a {b}"}]
+    assert extractor.feed("'s2', 'ok': True,}") == [extract_json("{\"id\": 's2', 'ok': True,}")]